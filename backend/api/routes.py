@@ -1,26 +1,271 @@
 """
 API 路由定义
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ValidationError
+import orjson
 from typing import Optional
+from datetime import datetime
+from urllib.parse import quote
+import asyncio
 import logging
+import os
 
-from schema.response import AnalyzeResponse, ErrorResponse, AnalysisReport
-from services.image_analyzer import get_image_analyzer
-from services.sentiment_analyzer import get_sentiment_analyzer
-from services.report_generator import get_report_generator
+from schema.response import (
+    AnalyzeResponse, ErrorResponse, AnalysisReport,
+    ScreenshotExtraction, BatchExtractionResponse
+)
+from services.image_analyzer import ImageAnalyzer, get_image_analyzer
+from services.sentiment_analyzer import SentimentAnalyzer, get_sentiment_analyzer
+from services.report_generator import ReportGenerator, get_report_generator
 from services.excel_exporter import get_excel_exporter
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["analysis"])
 
+# 单次请求最多上传的截图数量
+MAX_IMAGES = 20
+# 单张截图大小上限
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+# 单次上传请求体大小上限（额外预留 1MB 给 multipart 边界和表单字段）
+MAX_UPLOAD_BYTES = MAX_IMAGES * MAX_IMAGE_BYTES + 1024 * 1024
+# 读取上传文件时的分块大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# 支持的图片格式
+ALLOWED_MIME = frozenset({"image/png", "image/jpeg", "image/jpg", "image/webp"})
+
+# 详情页帖子保留的字段及缺省值
+_POST_KEYS = (
+    "title", "content", "author", "publish_time",
+    "likes", "collects", "comments_count", "tags"
+)
+_POST_DEFAULTS = {"title": "", "content": "", "author": "", "tags": ()}
+
+# Excel 导出配置
+# 设为 1 时对导出请求体做完整的 AnalysisReport 校验（调试用）
+STRICT_EXPORT_VALIDATION = os.getenv("STRICT_EXPORT_VALIDATION") == "1"
+# 导出器逐行遍历的列表字段与按键读取的对象字段，出现时须为对应类型
+_EXPORT_LIST_FIELDS = ("posts", "top_keywords", "risk_alerts")
+_EXPORT_DICT_FIELDS = ("sentiment_distribution",)
+EXPORT_FILENAME_PREFIX = "小红书舆情分析报告_"
+EXPORT_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CONTENT_DISPOSITION_TEMPLATE = "attachment; filename*=UTF-8''{}"
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _check_export_shape(report_dict: dict) -> Optional[str]:
+    """
+    检查导出请求体中导出器会遍历的字段结构（不做逐字段的完整校验）
+    
+    Args:
+        report_dict: 解析后的报告数据
+        
+    Returns:
+        结构不符时的错误描述，结构正确时返回 None
+    """
+    for field in _EXPORT_LIST_FIELDS:
+        if field not in report_dict:
+            continue
+        value = report_dict[field]
+        if not isinstance(value, list):
+            return f"{field} 应为数组"
+        if not all(isinstance(item, dict) for item in value):
+            return f"{field} 的每一项应为对象"
+    for field in _EXPORT_DICT_FIELDS:
+        if field in report_dict and not isinstance(report_dict[field], dict):
+            return f"{field} 应为对象"
+    return None
+
+
+async def read_capped(upload: UploadFile, limit: int) -> bytes:
+    """
+    分块读取上传文件，超过大小上限时立即中止
+    
+    Args:
+        upload: 上传的文件
+        limit: 允许的最大字节数
+        
+    Returns:
+        文件的二进制数据
+    """
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"文件 {upload.filename} 超过 {limit // (1024 * 1024)}MB 大小限制"
+            )
+    return bytes(buffer)
+
+
+async def validate_and_read(image: UploadFile) -> bytes:
+    """
+    校验图片格式并读取图片数据
+    
+    Args:
+        image: 上传的图片文件
+        
+    Returns:
+        图片的二进制数据
+    """
+    if image.content_type not in ALLOWED_MIME:
+        raise HTTPException(
+            status_code=400,
+            detail=f"文件 {image.filename} 格式不支持，请上传 PNG、JPG 或 WebP 格式的图片"
+        )
+    return await read_capped(image, MAX_IMAGE_BYTES)
+
+
+async def read_uploads(images: list[UploadFile]) -> list[bytes]:
+    """
+    校验上传的截图数量与格式，并并发读取全部截图
+    
+    Args:
+        images: 上传的图片文件列表
+        
+    Returns:
+        与上传顺序一致的图片二进制数据列表
+    """
+    # 验证图片数量
+    if len(images) > MAX_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"最多只能上传 {MAX_IMAGES} 张图片"
+        )
+    
+    if len(images) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="请至少上传 1 张图片"
+        )
+    
+    # 验证文件类型并读取图片数据，任一文件不合法时取消其余读取
+    read_tasks = [asyncio.ensure_future(validate_and_read(image)) for image in images]
+    try:
+        payloads = await asyncio.gather(*read_tasks)
+    except HTTPException:
+        for task in read_tasks:
+            task.cancel()
+        raise
+    
+    if logger.isEnabledFor(logging.INFO):
+        for idx, (image, image_data) in enumerate(zip(images, payloads)):
+            logger.info("处理第 %d/%d 张图片: %s, 大小: %d bytes", idx + 1, len(images), image.filename, len(image_data))
+    
+    return payloads
+
+
+def _model_response(model: BaseModel) -> Response:
+    """
+    直接用 Pydantic 序列化器输出 JSON，跳过 response_model 的二次校验
+    """
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
+
+def _resolve_service(request: Request, name: str, factory):
+    """优先使用应用启动时创建的服务实例，未创建时再延迟初始化"""
+    service = getattr(request.app.state, name, None)
+    if service is None:
+        try:
+            service = factory()
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=f"服务未就绪: {e}")
+    return service
+
+
+def provide_image_analyzer(request: Request) -> ImageAnalyzer:
+    """获取图像分析器"""
+    return _resolve_service(request, "image_analyzer", get_image_analyzer)
+
+
+def provide_sentiment_analyzer(request: Request) -> SentimentAnalyzer:
+    """获取情感分析器"""
+    return _resolve_service(request, "sentiment_analyzer", get_sentiment_analyzer)
+
+
+def provide_report_generator(request: Request) -> ReportGenerator:
+    """获取报告生成器"""
+    return _resolve_service(request, "report_generator", get_report_generator)
+
+
+def _tag_screenshot_index(posts: list, screenshot_index: int) -> list:
+    """为帖子附加来源截图序号（生成新字典，不修改识别结果；跳过非字典的条目）"""
+    return [
+        {**post, "screenshot_index": screenshot_index}
+        for post in posts
+        if isinstance(post, dict)
+    ]
+
+
+def normalize_extraction(extraction_result: dict, idx: int) -> tuple[list, list]:
+    """
+    将单张截图的识别结果转换为帖子列表和评论列表
+    
+    Args:
+        extraction_result: 图像识别返回的结果字典
+        idx: 截图在上传列表中的下标（从 0 开始）
+        
+    Returns:
+        (帖子数据列表, 评论数据列表)
+    """
+    screenshot_type = extraction_result.get("screenshot_type", "unknown")
+    logger.info("第 %d 张图片识别为: %s", idx + 1, screenshot_type)
+    
+    # 处理新的数据结构
+    if screenshot_type == "detail_view":
+        # 详情页截图，包含帖子内容和评论
+        post_content = extraction_result.get("post_content")
+        comments = extraction_result.get("comments") or []
+        
+        if not post_content or not isinstance(post_content, dict):
+            logger.warning("第 %d 张图片未能识别到帖子内容", idx + 1)
+            return [], []
+        
+        # 将帖子内容转换为旧格式以兼容现有分析流程（缺失或为 null 的字段取缺省值）
+        screenshot_index = idx + 1
+        comments = [comment for comment in comments if isinstance(comment, dict)]
+        post_data = {
+            key: _POST_DEFAULTS.get(key) if value is None else value
+            for key, value in ((key, post_content.get(key)) for key in _POST_KEYS)
+        } | {"screenshot_index": screenshot_index, "has_comments": bool(comments)}
+        
+        # 保存评论数据（附加帖子标题以便关联）
+        title = post_data["title"]
+        comments = [
+            {**comment, "post_title": title, "screenshot_index": screenshot_index}
+            for comment in comments
+        ]
+        
+        logger.info("从第 %d 张图片中识别到 1 个帖子和 %d 条评论", idx + 1, len(comments))
+        return [post_data], comments
+    
+    if screenshot_type == "feed_view":
+        # 信息流截图，可能包含多个帖子封面
+        # 这种情况下保持兼容旧的 posts 数组格式
+        posts_data = _tag_screenshot_index(extraction_result.get("posts") or [], idx + 1)
+        logger.info("从第 %d 张图片（信息流）中识别到 %d 个帖子封面", idx + 1, len(posts_data))
+        return posts_data, []
+    
+    # 未知类型或旧格式，尝试兼容处理
+    posts_data = _tag_screenshot_index(extraction_result.get("posts") or [], idx + 1)
+    if posts_data:
+        logger.info("从第 %d 张图片中识别到 %d 个帖子", idx + 1, len(posts_data))
+    return posts_data, []
+
 
 @router.post(
     "/analyze",
-    response_model=AnalyzeResponse,
+    response_class=Response,
     responses={
+        200: {"model": AnalyzeResponse},
         400: {"model": ErrorResponse},
         500: {"model": ErrorResponse}
     }
@@ -30,7 +275,10 @@ async def analyze_screenshot(
     search_keyword: Optional[str] = Form(
         default=None, 
         description="搜索关键词（可选）"
-    )
+    ),
+    image_analyzer: ImageAnalyzer = Depends(provide_image_analyzer),
+    sentiment_analyzer: SentimentAnalyzer = Depends(provide_sentiment_analyzer),
+    report_generator: ReportGenerator = Depends(provide_report_generator)
 ):
     """
     分析小红书截图并生成舆情报告
@@ -45,107 +293,40 @@ async def analyze_screenshot(
     - 风险预警
     - 分析洞察和建议
     """
-    # 验证图片数量
-    if len(images) > 20:
-        raise HTTPException(
-            status_code=400,
-            detail="最多只能上传 20 张图片"
-        )
-    
-    if len(images) == 0:
-        raise HTTPException(
-            status_code=400,
-            detail="请至少上传 1 张图片"
-        )
-    
-    # 验证文件类型
-    for image in images:
-        if image.content_type not in ["image/png", "image/jpeg", "image/jpg", "image/webp"]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"文件 {image.filename} 格式不支持，请上传 PNG、JPG 或 WebP 格式的图片"
-            )
+    payloads = await read_uploads(images)
     
     try:
         all_posts_data = []
         all_comments_data = []
         
-        # 逐个处理每张图片
-        for idx, image in enumerate(images):
-            # 读取图片数据
-            image_data = await image.read()
-            logger.info(f"处理第 {idx+1}/{len(images)} 张图片: {image.filename}, 大小: {len(image_data)} bytes")
-            
-            # Step 1: 图像识别 - 提取帖子信息和评论
-            image_analyzer = get_image_analyzer()
-            extraction_result = await image_analyzer.analyze_image(
-                image_data, 
-                mime_type=image.content_type
-            )
-            
-            screenshot_type = extraction_result.get("screenshot_type", "unknown")
-            logger.info(f"第 {idx+1} 张图片识别为: {screenshot_type}")
+        # Step 1: 图像识别 - 多张截图合并为一次请求，各批次并发执行
+        results = await image_analyzer.analyze_images(
+            [(image_data, image.content_type) for image, image_data in zip(images, payloads)]
+        )
+        
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures and len(failures) == len(results):
+            raise failures[0]
+        
+        for idx, extraction_result in enumerate(results):
+            if isinstance(extraction_result, Exception):
+                logger.warning("第 %d 张图片识别失败，已跳过: %s", idx + 1, extraction_result)
+                continue
             
-            # 处理新的数据结构
-            if screenshot_type == "detail_view":
-                # 详情页截图，包含帖子内容和评论
-                post_content = extraction_result.get("post_content")
-                comments = extraction_result.get("comments", [])
-                
-                if post_content:
-                    # 将帖子内容转换为旧格式以兼容现有分析流程
-                    post_data = {
-                        "title": post_content.get("title", ""),
-                        "content": post_content.get("content", ""),
-                        "author": post_content.get("author", ""),
-                        "publish_time": post_content.get("publish_time"),
-                        "likes": post_content.get("likes"),
-                        "collects": post_content.get("collects"),
-                        "comments_count": post_content.get("comments_count"),
-                        "tags": post_content.get("tags", []),
-                        "screenshot_index": idx + 1,
-                        "has_comments": len(comments) > 0
-                    }
-                    all_posts_data.append(post_data)
-                    
-                    # 保存评论数据（附加帖子标题以便关联）
-                    for comment in comments:
-                        comment["post_title"] = post_content.get("title", "")
-                        comment["screenshot_index"] = idx + 1
-                    all_comments_data.extend(comments)
-                    
-                    logger.info(f"从第 {idx+1} 张图片中识别到 1 个帖子和 {len(comments)} 条评论")
-                else:
-                    logger.warning(f"第 {idx+1} 张图片未能识别到帖子内容")
-                    
-            elif screenshot_type == "feed_view":
-                # 信息流截图，可能包含多个帖子封面
-                # 这种情况下保持兼容旧的 posts 数组格式
-                posts_data = extraction_result.get("posts", [])
-                for post in posts_data:
-                    post["screenshot_index"] = idx + 1
-                all_posts_data.extend(posts_data)
-                logger.info(f"从第 {idx+1} 张图片（信息流）中识别到 {len(posts_data)} 个帖子封面")
-            else:
-                # 未知类型或旧格式，尝试兼容处理
-                posts_data = extraction_result.get("posts", [])
-                if posts_data:
-                    for post in posts_data:
-                        post["screenshot_index"] = idx + 1
-                    all_posts_data.extend(posts_data)
-                    logger.info(f"从第 {idx+1} 张图片中识别到 {len(posts_data)} 个帖子")
-        
-        logger.info(f"共识别到 {len(all_posts_data)} 个帖子，{len(all_comments_data)} 条评论")
+            posts, comments = normalize_extraction(extraction_result, idx)
+            all_posts_data.extend(posts)
+            all_comments_data.extend(comments)
+        
+        logger.info("共识别到 %d 个帖子，%d 条评论", len(all_posts_data), len(all_comments_data))
         
         if not all_posts_data:
-            return AnalyzeResponse(
+            return _model_response(AnalyzeResponse(
                 success=True,
                 message="未能从截图中识别到小红书帖子内容",
                 data=None
-            )
+            ))
         
         # Step 2: 情感分析（对所有帖子进行统一分析）
-        sentiment_analyzer = get_sentiment_analyzer()
         sentiment_result = await sentiment_analyzer.analyze_sentiment(all_posts_data)
         
         # 合并帖子信息和情感分析结果
@@ -155,7 +336,6 @@ async def analyze_screenshot(
         )
         
         # Step 3: 生成舆情报告
-        report_generator = get_report_generator()
         report = await report_generator.generate_report(
             posts=analyzed_posts,
             keywords_data=sentiment_result.get("top_keywords", []),
@@ -164,20 +344,74 @@ async def analyze_screenshot(
             search_keyword=search_keyword
         )
         
-        return AnalyzeResponse(
+        return _model_response(AnalyzeResponse(
             success=True,
             message=f"舆情分析完成，共分析 {len(images)} 张图片，识别到 {len(all_posts_data)} 个帖子",
             data=report
-        )
+        ))
         
     except Exception as e:
-        logger.error(f"分析过程发生错误: {e}", exc_info=True)
+        logger.error("分析过程发生错误: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"分析过程发生错误: {str(e)}"
         )
 
 
+@router.post(
+    "/analyze/batch",
+    response_class=Response,
+    responses={
+        200: {"model": BatchExtractionResponse},
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse}
+    }
+)
+async def analyze_screenshots_batch(
+    images: list[UploadFile] = File(..., description="小红书截图（最多20张）"),
+    image_analyzer: ImageAnalyzer = Depends(provide_image_analyzer)
+):
+    """
+    批量识别小红书截图（仅图像识别，不做情感分析和报告生成）
+    
+    - **images**: 小红书截图文件列表（PNG/JPG/WebP），最多20张
+    
+    所有截图在服务端并发识别，按上传顺序逐张返回识别结果；
+    单张截图识别失败不影响其余截图。
+    """
+    payloads = await read_uploads(images)
+    
+    results = await image_analyzer.analyze_images(
+        [(image_data, image.content_type) for image, image_data in zip(images, payloads)]
+    )
+    
+    items = []
+    for idx, (image, extraction_result) in enumerate(zip(images, results), 1):
+        if isinstance(extraction_result, BaseException):
+            logger.warning("第 %d 张图片识别失败: %s", idx, extraction_result)
+            items.append(ScreenshotExtraction(
+                screenshot_index=idx,
+                filename=image.filename,
+                success=False,
+                error=str(extraction_result) or type(extraction_result).__name__
+            ))
+        else:
+            items.append(ScreenshotExtraction(
+                screenshot_index=idx,
+                filename=image.filename,
+                success="error" not in extraction_result,
+                result=extraction_result,
+                error=extraction_result.get("error")
+            ))
+    
+    succeeded = sum(item.success for item in items)
+    return _model_response(BatchExtractionResponse(
+        success=succeeded > 0,
+        message=f"共识别 {len(items)} 张图片，成功 {succeeded} 张",
+        results=items
+    ))
+
+
 @router.get("/health")
 async def health_check():
     """
@@ -186,44 +420,81 @@ async def health_check():
     return {"status": "healthy", "service": "sentiment-analysis"}
 
 
-@router.post("/export/excel")
-async def export_to_excel(report: AnalysisReport):
+@router.post(
+    "/export/excel",
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/AnalysisReport"}
+                }
+            },
+            "required": True
+        }
+    }
+)
+async def export_to_excel(request: Request):
     """
     导出分析报告为 Excel 文件
     
-    - **report**: 分析报告数据对象
+    - **report**: 分析报告数据对象（即 /api/analyze 返回的 data 字段）
     
     返回 Excel 文件供下载
     """
+    # 直接解析原始 JSON，导出器按字典读取字段，无需逐字段校验
+    try:
+        report_dict = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="报告数据不是合法的 JSON")
+    if not isinstance(report_dict, dict):
+        raise HTTPException(status_code=400, detail="报告数据格式错误")
+    
+    if STRICT_EXPORT_VALIDATION:
+        try:
+            AnalysisReport.model_validate(report_dict)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    
+    shape_error = _check_export_shape(report_dict)
+    if shape_error:
+        raise HTTPException(status_code=400, detail=f"报告数据格式错误: {shape_error}")
+    
     try:
         # 获取 Excel 导出器
         exporter = get_excel_exporter()
         
-        # 将报告数据转换为字典
-        report_dict = report.model_dump() if hasattr(report, 'model_dump') else report.dict()
-        
         # 生成 Excel 文件
         excel_file = await exporter.export_analysis_report(report_dict)
         
-        # 生成文件名
-        from datetime import datetime
-        from urllib.parse import quote
+        # 先定位到末尾取得文件大小，再回到开头分块发送
+        size = excel_file.seek(0, os.SEEK_END)
+        excel_file.seek(0)
         
-        filename = f"小红书舆情分析报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        # 生成文件名
+        filename = f"{EXPORT_FILENAME_PREFIX}{datetime.now().strftime(EXPORT_TIMESTAMP_FORMAT)}.xlsx"
         encoded_filename = quote(filename)
         
-        # 返回文件流
+        # 以文件流返回，发送完成后关闭临时文件
         return StreamingResponse(
-            excel_file,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            iter(lambda: excel_file.read(EXPORT_CHUNK_SIZE), b""),
+            media_type=XLSX_MEDIA_TYPE,
             headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+                "Content-Disposition": CONTENT_DISPOSITION_TEMPLATE.format(encoded_filename),
+                "Content-Length": str(size),
                 "Access-Control-Expose-Headers": "Content-Disposition"
-            }
+            },
+            background=BackgroundTask(excel_file.close)
         )
         
+    except (TypeError, AttributeError) as e:
+        # 帖子等行内字段类型不符（如 content 不是字符串），属于请求数据错误
+        logger.warning("Excel 导出请求数据格式错误: %s", e)
+        raise HTTPException(
+            status_code=400,
+            detail=f"报告数据格式错误: {str(e)}"
+        )
     except Exception as e:
-        logger.error(f"Excel 导出失败: {e}", exc_info=True)
+        logger.error("Excel 导出失败: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Excel 导出失败: {str(e)}"
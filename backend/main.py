@@ -3,21 +3,29 @@
 FastAPI 应用入口
 """
 import os
+import sys
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
+from api.responses import ORJSONResponse
+
 # 加载环境变量
 load_dotenv()
 
 # 配置日志
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+# 关闭逐请求的访问日志，上传接口请求频繁时可减少日志开销
+logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
 # 检查豆包 API Key 配置
 api_key = os.getenv("DOUBAO_API_KEY")
 if api_key:
@@ -25,28 +33,78 @@ if api_key:
 else:
     logger.warning("未找到 DOUBAO_API_KEY 环境变量")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期 - 启动时预先创建各服务实例，避免在请求中初始化
+    """
+    from services.doubao_api import aclose_client
+    from services.image_analyzer import get_image_analyzer
+    from services.sentiment_analyzer import get_sentiment_analyzer
+    from services.report_generator import get_report_generator
+    
+    try:
+        app.state.image_analyzer = get_image_analyzer()
+        app.state.sentiment_analyzer = get_sentiment_analyzer()
+        app.state.report_generator = get_report_generator()
+    except ValueError as e:
+        logger.warning("服务预初始化失败: %s", e)
+    
+    yield
+    
+    # 关闭豆包 API 连接池
+    await aclose_client()
+
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="小红书舆情分析工具",
     description="上传小红书截图，自动识别内容并生成舆情分析报告（基于豆包 AI）",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-# 配置 CORS
+# 注册路由
+from api.routes import router as api_router, MAX_UPLOAD_BYTES
+app.include_router(api_router)
+
+# 接收截图上传、需要在解析请求体前检查大小的接口
+UPLOAD_PATHS = frozenset({"/api/analyze", "/api/analyze/batch"})
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """
+    在解析 multipart 请求体之前，按 Content-Length 拒绝过大的上传
+    """
+    if request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"上传内容过大，总大小不能超过 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"}
+            )
+    return await call_next(request)
+
+
+# 配置 CORS（来源白名单由 CORS_ORIGINS 指定，逗号分隔）
+# 最后注册使其位于最外层，提前返回的 413 响应同样带有 CORS 头
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if origin.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 开发环境允许所有来源
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ORIGINS,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
-# 注册路由
-from api.routes import router as api_router
-app.include_router(api_router)
-
 
 @app.get("/")
 async def root():
@@ -64,9 +122,15 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
+    
+    # DEV=1 时开启热重载（单进程），否则按 WEB_CONCURRENCY 启动多个 worker
+    dev_mode = os.getenv("DEV") == "1"
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
-        port=8000,
-        reload=True
+        port=int(os.getenv("PORT", "8000")),
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=None if dev_mode else int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        reload=dev_mode
     )
@@ -10,7 +10,9 @@ from schema.response import (
     SentimentDistribution,
     KeywordInfo,
     RiskAlert,
-    ErrorResponse
+    ErrorResponse,
+    ScreenshotExtraction,
+    BatchExtractionResponse
 )
 
 __all__ = [
@@ -23,5 +25,7 @@ __all__ = [
     "SentimentDistribution",
     "KeywordInfo",
     "RiskAlert",
-    "ErrorResponse"
+    "ErrorResponse",
+    "ScreenshotExtraction",
+    "BatchExtractionResponse"
 ]
@@ -2,7 +2,7 @@
 响应数据模型
 """
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import Optional
 from enum import Enum
 
 
@@ -30,7 +30,7 @@ class CommentInfo(BaseModel):
     likes: Optional[int] = Field(default=None, description="评论点赞数")
     time: Optional[str] = Field(default=None, description="评论时间")
     is_author_reply: bool = Field(default=False, description="是否为作者回复")
-    replies: List[CommentReply] = Field(default_factory=list, description="回复列表")
+    replies: list[CommentReply] = Field(default_factory=list, description="回复列表")
     post_title: Optional[str] = Field(default=None, description="所属帖子标题")
     screenshot_index: Optional[int] = Field(default=None, description="来源截图序号")
 
@@ -49,7 +49,7 @@ class PostInfo(BaseModel):
         ge=-1.0, le=1.0,
         description="情感得分，-1 到 1 之间"
     )
-    keywords: List[str] = Field(default_factory=list, description="关键词列表")
+    keywords: list[str] = Field(default_factory=list, description="关键词列表")
 
 
 
@@ -80,7 +80,7 @@ class RiskAlert(BaseModel):
     """
     level: str = Field(description="风险等级: high/medium/low")
     description: str = Field(description="风险描述")
-    related_posts: List[str] = Field(default_factory=list, description="相关帖子标题")
+    related_posts: list[str] = Field(default_factory=list, description="相关帖子标题")
 
 
 class AnalysisReport(BaseModel):
@@ -92,13 +92,13 @@ class AnalysisReport(BaseModel):
     total_posts: int = Field(description="识别的帖子总数")
     total_comments: int = Field(default=0, description="识别的评论总数")
     sentiment_distribution: SentimentDistribution = Field(description="情感分布")
-    top_keywords: List[KeywordInfo] = Field(description="热门关键词")
-    posts: List[PostInfo] = Field(description="帖子详情列表")
-    comments: List[CommentInfo] = Field(default_factory=list, description="评论列表")
-    risk_alerts: List[RiskAlert] = Field(default_factory=list, description="风险预警")
+    top_keywords: list[KeywordInfo] = Field(description="热门关键词")
+    posts: list[PostInfo] = Field(description="帖子详情列表")
+    comments: list[CommentInfo] = Field(default_factory=list, description="评论列表")
+    risk_alerts: list[RiskAlert] = Field(default_factory=list, description="风险预警")
     summary: str = Field(description="舆情分析总结")
-    insights: List[str] = Field(default_factory=list, description="关键洞察")
-    recommendations: List[str] = Field(default_factory=list, description="建议措施")
+    insights: list[str] = Field(default_factory=list, description="关键洞察")
+    recommendations: list[str] = Field(default_factory=list, description="建议措施")
     created_at: str = Field(description="报告生成时间")
 
 
@@ -112,6 +112,26 @@ class AnalyzeResponse(BaseModel):
     data: Optional[AnalysisReport] = Field(default=None, description="分析报告")
 
 
+class ScreenshotExtraction(BaseModel):
+    """
+    单张截图的识别结果
+    """
+    screenshot_index: int = Field(description="截图序号（从 1 开始）")
+    filename: Optional[str] = Field(default=None, description="上传的文件名")
+    success: bool = Field(description="是否识别成功")
+    result: Optional[dict] = Field(default=None, description="豆包返回的原始识别结果")
+    error: Optional[str] = Field(default=None, description="识别失败原因")
+
+
+class BatchExtractionResponse(BaseModel):
+    """
+    批量截图识别接口响应
+    """
+    success: bool = Field(description="是否成功")
+    message: str = Field(description="响应消息")
+    results: list[ScreenshotExtraction] = Field(default_factory=list, description="与上传顺序一致的识别结果")
+
+
 class ErrorResponse(BaseModel):
     """
     错误响应
@@ -0,0 +1,135 @@
+"""
+缓存服务
+用于复用耗时的豆包 API 调用结果：默认使用进程内 LRU 缓存，
+配置 REDIS_URL 后改用 Redis，多个 worker 与重启之间共享结果
+"""
+from __future__ import annotations
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis 为可选依赖
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存
+    
+    仅在单个事件循环内使用，读写过程中没有 await，因此无需加锁。
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        初始化缓存
+        
+        Args:
+            maxsize: 最多保留的条目数，为 0 时禁用缓存
+            ttl: 条目有效期（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """
+        读取缓存，不存在或已过期时返回 None
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any) -> None:
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+        """
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    async def aget(self, key: str) -> Optional[Any]:
+        """异步读取接口，与 RedisCache 保持一致"""
+        return self.get(key)
+    
+    async def aset(self, key: str, value: Any) -> None:
+        """异步写入接口，与 RedisCache 保持一致"""
+        self.set(key, value)
+
+
+class RedisCache:
+    """
+    基于 Redis 的缓存，值以字节串保存
+    
+    Redis 不可用时读写失败只记录警告并按未命中处理，不影响主流程。
+    """
+    
+    def __init__(self, url: str, ttl: float):
+        """
+        初始化缓存
+        
+        Args:
+            url: Redis 连接地址，如 redis://localhost:6379/0
+            ttl: 条目有效期（秒）
+        """
+        self.ttl = int(ttl)
+        self._redis = aioredis.from_url(url)
+    
+    async def aget(self, key: str) -> Optional[bytes]:
+        """
+        读取缓存，不存在或 Redis 不可用时返回 None
+        """
+        try:
+            return await self._redis.get(key)
+        except aioredis.RedisError as e:
+            logger.warning("读取 Redis 缓存失败: %s", e)
+            return None
+    
+    async def aset(self, key: str, value: Union[str, bytes]) -> None:
+        """
+        写入缓存并设置过期时间
+        """
+        try:
+            await self._redis.set(key, value, ex=self.ttl)
+        except aioredis.RedisError as e:
+            logger.warning("写入 Redis 缓存失败: %s", e)
+
+
+def create_result_cache(
+    maxsize: int,
+    ttl: float,
+    redis_url: Optional[str] = None,
+    redis_ttl: Optional[float] = None
+) -> Union[TTLCache, RedisCache]:
+    """
+    创建 API 结果缓存：配置了 Redis 地址且已安装 redis 库时使用 Redis，否则使用进程内缓存
+    
+    Args:
+        maxsize: 进程内缓存的最大条目数
+        ttl: 进程内缓存的有效期（秒）
+        redis_url: Redis 连接地址，为空时不使用 Redis
+        redis_ttl: Redis 缓存的有效期（秒），为空时与 ttl 相同
+        
+    Returns:
+        提供 aget/aset 接口的缓存实例
+    """
+    if redis_url:
+        if aioredis is None:
+            logger.warning("已配置 REDIS_URL 但未安装 redis 库，改用进程内缓存")
+        else:
+            logger.info("API 结果缓存使用 Redis")
+            return RedisCache(redis_url, redis_ttl if redis_ttl is not None else ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,237 @@
+"""
+豆包 API 公共工具
+图像识别、情感分析与报告生成共用的连接池、请求重试与响应解析逻辑
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import httpx
+import orjson
+from typing import Any, Dict, List, Optional
+from schema.response import SentimentType
+
+logger = logging.getLogger(__name__)
+
+# 豆包 API 配置
+DOUBAO_API_URL = "https://ark.cn-beijing.volces.com/api/v3/responses"
+DOUBAO_MODEL = "doubao-seed-1-8-251228"
+
+# 文本类调用（情感分析、洞察生成）的超时：连接、写入和等待连接池要快速失败，
+# 读取需覆盖模型生成完整 JSON 的时间
+DOUBAO_READ_TIMEOUT = float(os.getenv("DOUBAO_READ_TIMEOUT", "60"))
+DOUBAO_TIMEOUT = httpx.Timeout(connect=5.0, read=DOUBAO_READ_TIMEOUT, write=10.0, pool=5.0)
+
+# 请求失败时的最大重试次数，以及指数退避的初始和最大间隔（秒）
+# 读取超时不重试：模型迟迟不返回时重试只会把等待时间成倍放大
+DOUBAO_MAX_RETRIES = int(os.getenv("DOUBAO_MAX_RETRIES", "2"))
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 4.0
+# 可重试的状态码：限流与服务端临时错误
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# 匹配模型输出首尾的 markdown 代码块标记（```json / ```）及空白
+_FENCE_RE = re.compile(r"\A\s*(?:```(?:json)?)?\s*|\s*(?:```)?\s*\Z")
+
+# 情感字符串到枚举的映射，未知取值按中性处理
+SENTIMENT_LOOKUP = {sentiment.value: sentiment for sentiment in SentimentType}
+
+
+def extract_output_text(result: Dict[str, Any]) -> str:
+    """
+    从豆包 API 响应中取出模型输出的文本
+    
+    实际响应结构: { "output": [ { "type": "message", "content": [ { "type": "output_text", "text": "..." } ] } ] }
+    同时兼容 output 为 dict / str 的旧格式，以及 OpenAI 格式的 choices 响应。
+    
+    Args:
+        result: 豆包 API 返回的 JSON 对象
+        
+    Returns:
+        模型输出文本，无法解析时返回空字符串
+    """
+    # 常见情况：output[0] 即为唯一的 message，其 content[0] 即为 output_text，直接按下标取值
+    try:
+        message = result["output"][0]
+        first = message["content"][0]
+        if message["type"] == "message" and first["type"] == "output_text":
+            return first["text"]
+    except (KeyError, IndexError, TypeError):
+        pass
+    
+    output = result.get("output")
+    if isinstance(output, list):
+        message = next(
+            (item for item in output if isinstance(item, dict) and item.get("type") == "message"),
+            None
+        )
+        if message is None:
+            return ""
+        # content 可能为 null，按空列表处理
+        content = message.get("content") or []
+        if isinstance(content, str):
+            return content
+        return next(
+            (c.get("text", "") for c in content if isinstance(c, dict) and c.get("type") == "output_text"),
+            ""
+        )
+    # output 是 dict 格式（旧格式兼容）
+    if isinstance(output, dict):
+        return output.get("content", "")
+    if isinstance(output, str):
+        return output
+    
+    # 兼容 OpenAI 格式的响应
+    choices = result.get("choices")
+    if choices:
+        return choices[0].get("message", {}).get("content", "")
+    return ""
+
+
+def strip_fences(text: str) -> str:
+    """移除模型输出首尾可能存在的 markdown 代码块标记及空白"""
+    return _FENCE_RE.sub("", text)
+
+
+def prompt_cache_key(namespace: str, prompt: str) -> str:
+    """
+    生成文本类调用结果的缓存键
+    
+    由调用类型、模型名和完整提示词的 BLAKE2b 摘要组成，输入数据或提示词变化后不会命中旧结果。
+    
+    Args:
+        namespace: 调用类型，如 sentiment / insights
+        prompt: 完整提示词
+        
+    Returns:
+        形如 doubao:{namespace}:{model}:{digest} 的缓存键
+    """
+    digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+    return f"doubao:{namespace}:{DOUBAO_MODEL}:{digest}"
+
+
+def to_sentiment(value: Any) -> SentimentType:
+    """将模型输出的情感字段转为枚举，非字符串（如列表、字典）或未知取值按中性处理"""
+    if not isinstance(value, str):
+        return SentimentType.NEUTRAL
+    return SENTIMENT_LOOKUP.get(value, SentimentType.NEUTRAL)
+
+
+def to_int(value: Any) -> Optional[int]:
+    """将模型输出中的数值字段转为 int，无法转换时返回 None"""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_str_list(value: Any) -> List[str]:
+    """将模型输出中的列表字段整理为字符串列表，类型不符时返回空列表"""
+    if not isinstance(value, list):
+        return []
+    return [str(item) for item in value]
+
+
+async def post_with_retry(client: httpx.AsyncClient, url: str, **kwargs: Any) -> httpx.Response:
+    """
+    发送 POST 请求，连接失败、网络错误或限流/服务端临时错误时按指数退避重试
+    
+    读取超时（ReadTimeout）直接抛出，单次调用的最长耗时不超过一个读取超时加少量连接重试
+    
+    Args:
+        client: 发送请求使用的 HTTP 客户端
+        url: 请求地址
+        **kwargs: 透传给 client.post 的参数
+        
+    Returns:
+        状态码为 2xx 的响应
+        
+    Raises:
+        httpx.TransportError: 读取超时，或重试次数用尽后仍连接失败/网络错误
+        httpx.HTTPStatusError: 响应状态码不可重试，或重试次数用尽
+    """
+    for attempt in range(DOUBAO_MAX_RETRIES + 1):
+        last_attempt = attempt == DOUBAO_MAX_RETRIES
+        try:
+            response = await client.post(url, **kwargs)
+        except httpx.TransportError as e:
+            if last_attempt or isinstance(e, httpx.ReadTimeout):
+                raise
+            reason = repr(e)
+        else:
+            if last_attempt or response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                return response
+            reason = f"HTTP {response.status_code}"
+        
+        delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt)
+        logger.warning("豆包 API 请求失败（%s），%.1f 秒后第 %d 次重试", reason, delay, attempt + 1)
+        await asyncio.sleep(delay)
+
+
+# 豆包 API 共享连接池（延迟创建）：启用 HTTP/2 多路复用并保持长连接，
+# 图像识别、情感分析与洞察生成的请求共用同一组连接
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """获取共享的 HTTP 客户端，首次调用时创建"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(180.0, connect=5.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+        )
+    return _client
+
+
+async def aclose_client() -> None:
+    """关闭共享的 HTTP 客户端，应用退出时调用"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def call_doubao(prompt: str, api_key: str) -> str:
+    """
+    以纯文本提示词调用豆包 API，失败时按 post_with_retry 的策略重试
+    
+    Args:
+        prompt: 提示词
+        api_key: 豆包 API Key
+        
+    Returns:
+        模型输出的文本，无法解析时返回空字符串
+    """
+    payload = {
+        "model": DOUBAO_MODEL,
+        "input": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": prompt
+                    }
+                ]
+            }
+        ]
+    }
+    
+    response = await post_with_retry(
+        get_client(),
+        DOUBAO_API_URL,
+        content=orjson.dumps(payload),
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        timeout=DOUBAO_TIMEOUT
+    )
+    return extract_output_text(orjson.loads(response.content))
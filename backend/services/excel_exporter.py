@@ -2,15 +2,144 @@
 Excel 导出服务
 将舆情分析报告导出为 Excel 文件
 """
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-from io import BytesIO
+from openpyxl import Workbook, LXML
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
 from datetime import datetime
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional, Tuple
 import logging
+import os
+import tempfile
 
 logger = logging.getLogger(__name__)
 
+# 导出文件在内存中保留的上限，超过后 SpooledTemporaryFile 转为磁盘临时文件
+EXCEL_SPOOL_MAX_SIZE = int(os.getenv("EXCEL_SPOOL_MAX_SIZE", str(8 << 20)))
+
+# openpyxl 在可导入 lxml 时使用 libxml2 序列化工作表，速度更快、内存更省
+if LXML:
+    logger.info("openpyxl 已启用 lxml 序列化")
+else:
+    logger.warning("openpyxl 未检测到 lxml，Excel 导出将回退到 xml.etree，请安装 lxml")
+
+
+# 颜色统一使用 8 位 ARGB，避免 6 位 RGB 被补成 00 透明度
+_COLOR_WHITE = 'FFFFFFFF'
+_COLOR_POSITIVE = 'FF22C55E'
+_COLOR_NEUTRAL = 'FF3B82F6'
+_COLOR_NEGATIVE = 'FFEF4444'
+_COLOR_WARNING = 'FFF59E0B'
+
+
+def _solid(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+
+# 样式对象不可变，模块级构造一次后在所有单元格间共享
+_FONT_TITLE = Font(name='微软雅黑', size=16, bold=True, color=_COLOR_WHITE)
+_FONT_SECTION = Font(name='微软雅黑', size=12, bold=True)
+_FONT_SHEET_TITLE = Font(name='微软雅黑', size=14, bold=True)
+_FONT_LABEL = Font(name='微软雅黑', bold=True)
+_FONT_HEADER_WHITE = Font(name='微软雅黑', bold=True, color=_COLOR_WHITE)
+_FONT_WHITE_BOLD = Font(bold=True, color=_COLOR_WHITE)
+_FONT_BOLD = Font(bold=True)
+_FONT_POSITIVE = Font(color=_COLOR_POSITIVE)
+_FONT_NEUTRAL = Font(color=_COLOR_NEUTRAL)
+_FONT_NEGATIVE = Font(color=_COLOR_NEGATIVE)
+
+_FILL_TITLE = _solid('FFFF2442')
+_FILL_SECTION = _solid('FFE8E8E8')
+_FILL_HEADER_GRAY = _solid('FFF0F0F0')
+_FILL_HEADER_BLUE = _solid('FF4472C4')
+_FILL_HEADER_ORANGE = _solid('FFFF6B00')
+_FILL_HEADER_RED = _solid('FFDC2626')
+_FILL_POSITIVE = _solid(_COLOR_POSITIVE)
+_FILL_NEUTRAL = _solid(_COLOR_NEUTRAL)
+_FILL_NEGATIVE = _solid(_COLOR_NEGATIVE)
+_FILL_HIGH = _FILL_NEGATIVE
+_FILL_MED = _solid(_COLOR_WARNING)
+_FILL_LOW = _FILL_NEUTRAL
+
+_ALIGN_CENTER = Alignment(horizontal='center', vertical='center')
+_ALIGN_H_CENTER = Alignment(horizontal='center')
+
+# 情感 / 风险等级 -> (显示文本, 填充样式)
+_SENTIMENT_BADGES = {
+    'positive': ('正面', _FILL_POSITIVE),
+    'neutral': ('中性', _FILL_NEUTRAL),
+    'negative': ('负面', _FILL_NEGATIVE),
+}
+_LEVEL_BADGES = {
+    'high': ('🔴 高风险', _FILL_HIGH),
+    'medium': ('🟡 中风险', _FILL_MED),
+    'low': ('🔵 低风险', _FILL_LOW),
+}
+
+
+class _Banner(NamedTuple):
+    """工作表首行的合并标题"""
+    text: str
+    merge_range: str
+    font: Font
+    fill: PatternFill
+    alignment: Optional[Alignment] = None
+    height: Optional[float] = None
+
+
+class _SheetLayout(NamedTuple):
+    """工作表骨架：与报告数据无关的标题、列宽、冻结位置、首行标题和表头"""
+    title: str
+    widths: Dict[str, float]
+    freeze_panes: Optional[str] = None
+    banner: Optional[_Banner] = None
+    headers: Tuple[str, ...] = ()
+    header_font: Optional[Font] = None
+    header_fill: Optional[PatternFill] = None
+    header_alignment: Optional[Alignment] = None
+
+
+# 各工作表骨架在模块加载时定义一次，每次导出只需填充数据行
+_SUMMARY_LAYOUT = _SheetLayout(
+    title="📊 分析概览",
+    widths={'A': 20, 'B': 30, 'C': 15, 'D': 15},
+    banner=_Banner('小红书舆情分析报告', 'A1:D1', _FONT_TITLE, _FILL_TITLE, _ALIGN_CENTER, height=30),
+)
+_POSTS_LAYOUT = _SheetLayout(
+    title="📝 帖子详情",
+    widths={'A': 8, 'B': 40, 'C': 50, 'D': 12, 'E': 12, 'F': 12, 'G': 30},
+    freeze_panes='A2',
+    headers=('序号', '标题', '内容摘要', '情感', '点赞数', '评论数', '关键词'),
+    header_font=_FONT_HEADER_WHITE,
+    header_fill=_FILL_HEADER_BLUE,
+    header_alignment=_ALIGN_CENTER,
+)
+_SENTIMENT_LAYOUT = _SheetLayout(
+    title="📈 情感分析",
+    widths={'A': 15, 'B': 12, 'C': 15, 'D': 12, 'E': 30},
+    banner=_Banner('情感分布统计', 'A1:E1', _FONT_SHEET_TITLE, _FILL_SECTION),
+    headers=('情感类型', '数量', '占比', '占比（%）', '趋势'),
+    header_font=_FONT_LABEL,
+    header_fill=_FILL_HEADER_GRAY,
+    header_alignment=_ALIGN_H_CENTER,
+)
+_KEYWORDS_LAYOUT = _SheetLayout(
+    title="🔥 热门关键词",
+    widths={'A': 8, 'B': 25, 'C': 15, 'D': 15},
+    freeze_panes='A2',
+    headers=('排名', '关键词', '出现次数', '情感倾向'),
+    header_font=_FONT_HEADER_WHITE,
+    header_fill=_FILL_HEADER_ORANGE,
+    header_alignment=_ALIGN_H_CENTER,
+)
+_ALERTS_LAYOUT = _SheetLayout(
+    title="⚠️ 风险预警",
+    widths={'A': 15, 'B': 80},
+    headers=('风险等级', '预警描述'),
+    header_font=_FONT_HEADER_WHITE,
+    header_fill=_FILL_HEADER_RED,
+    header_alignment=_ALIGN_H_CENTER,
+)
+
 
 class ExcelExporter:
     """Excel 导出器"""
@@ -18,21 +147,24 @@ class ExcelExporter:
     def __init__(self):
         self.wb = None
         
-    async def export_analysis_report(self, report_data: dict) -> BytesIO:
+    async def export_analysis_report(self, report_data: dict) -> IO[bytes]:
         """
         导出分析报告为 Excel 文件
         
+        报告写入 SpooledTemporaryFile：较小的报告留在内存中，超过阈值后自动落盘，
+        避免 BytesIO 随 ZIP 流式写入反复扩容拷贝。调用方负责读取后关闭文件对象。
+        工作簿使用 write_only 模式逐行流式写出，内存占用与行数无关。
+        
         Args:
             report_data: 分析报告数据字典
             
         Returns:
-            BytesIO: Excel 文件的字节流
+            IO[bytes]: 已定位到开头的 Excel 文件对象
         """
+        excel_file = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_SIZE)
         try:
-            self.wb = Workbook()
-            
-            # 移除默认的工作表
-            self.wb.remove(self.wb.active)
+            # write_only 工作簿没有默认工作表
+            self.wb = Workbook(write_only=True)
             
             # 创建多个工作表
             self._create_summary_sheet(report_data)
@@ -43,8 +175,7 @@ class ExcelExporter:
             if report_data.get('risk_alerts'):
                 self._create_alerts_sheet(report_data)
             
-            # 保存到内存
-            excel_file = BytesIO()
+            # 保存到临时文件
             self.wb.save(excel_file)
             excel_file.seek(0)
             
@@ -52,281 +183,258 @@ class ExcelExporter:
             return excel_file
             
         except Exception as e:
-            logger.error(f"Excel 导出失败: {e}", exc_info=True)
+            excel_file.close()
+            self._discard_workbook()
+            # 异常堆栈由调用方按错误类型记录，此处不重复输出
+            logger.error(f"Excel 导出失败: {e}")
             raise
+        finally:
+            self.wb = None
     
-    def _create_summary_sheet(self, report_data: dict):
-        """创建概览工作表"""
-        ws = self.wb.create_sheet("📊 分析概览")
+    def _discard_workbook(self):
+        """
+        结束导出失败时已创建的工作表写入流并删除其临时文件
+        
+        write_only 工作表在写入过程中保持着 lxml 的增量写入上下文，直接丢弃工作簿时
+        这些生成器在垃圾回收阶段才被关闭，会输出 "inconsistent exit action" 等异常并残留临时文件
+        """
+        for ws in self.wb.worksheets:
+            try:
+                ws.close()
+                ws._writer.cleanup()
+            except Exception as e:
+                logger.debug(f"清理工作表 {ws.title} 失败: {e}")
+    
+    @staticmethod
+    def _styled(ws, value, font=None, fill=None, alignment=None) -> WriteOnlyCell:
+        """构造带样式的 write_only 单元格"""
+        cell = WriteOnlyCell(ws, value=value)
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if alignment is not None:
+            cell.alignment = alignment
+        return cell
+    
+    @staticmethod
+    def _badge_cells(ws, badges: dict) -> dict:
+        """
+        为每种标签预先构造一个带样式的单元格
+        
+        write_only 模式下 append 时立即写出单元格，同一个单元格对象可以在多行间复用，
+        数据行只需按 key 取出，无需逐行新建单元格并重复登记样式。
         
-        # 标题样式
-        title_font = Font(name='微软雅黑', size=16, bold=True, color='FFFFFF')
-        title_fill = PatternFill(start_color='FF2442', end_color='FF2442', fill_type='solid')
+        Args:
+            ws: write_only 工作表
+            badges: key -> (显示文本, 填充样式)
+            
+        Returns:
+            dict: key -> WriteOnlyCell
+        """
+        return {
+            key: ExcelExporter._styled(
+                ws, label,
+                font=_FONT_WHITE_BOLD,
+                fill=fill,
+                alignment=_ALIGN_H_CENTER,
+            )
+            for key, (label, fill) in badges.items()
+        }
+    
+    def _start_sheet(self, layout: _SheetLayout):
+        """
+        按骨架创建工作表并写出首行标题和表头
         
-        # 标题
-        ws['A1'] = '小红书舆情分析报告'
-        ws['A1'].font = title_font
-        ws['A1'].fill = title_fill
-        ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-        ws.merge_cells('A1:D1')
-        ws.row_dimensions[1].height = 30
+        列宽、冻结位置和行高在 write_only 模式下须在写入第一行之前设置。
+        
+        Args:
+            layout: 工作表骨架
+            
+        Returns:
+            已写出骨架、可继续追加数据行的工作表
+        """
+        ws = self.wb.create_sheet(layout.title)
+        for col, width in layout.widths.items():
+            ws.column_dimensions[col].width = width
+        if layout.freeze_panes:
+            ws.freeze_panes = layout.freeze_panes
+        
+        banner = layout.banner
+        if banner is not None:
+            if banner.height:
+                ws.row_dimensions[1].height = banner.height
+            ws.append([self._styled(
+                ws, banner.text,
+                font=banner.font,
+                fill=banner.fill,
+                alignment=banner.alignment,
+            )])
+            ws.merged_cells.add(banner.merge_range)
+        
+        if layout.headers:
+            ws.append([
+                self._styled(
+                    ws, header,
+                    font=layout.header_font,
+                    fill=layout.header_fill,
+                    alignment=layout.header_alignment,
+                )
+                for header in layout.headers
+            ])
+        return ws
+    
+    def _create_summary_sheet(self, report_data: dict):
+        """创建概览工作表"""
+        ws = self._start_sheet(_SUMMARY_LAYOUT)
+        ws.append([])
         
         # 基本信息
-        row = 3
         info_items = [
             ('报告 ID', report_data.get('analysis_id', 'N/A')),
-            ('生成时间', datetime.fromisoformat(report_data.get('created_at', datetime.now().isoformat())).strftime('%Y-%m-%d %H:%M:%S')),
+            # created_at 为 ISO 格式字符串，直接截取到秒，无需解析为 datetime 再格式化
+            ('生成时间', (report_data.get('created_at') or datetime.now().isoformat())[:19].replace('T', ' ')),
             ('搜索关键词', report_data.get('search_keyword', '未指定')),
             ('识别帖子数', report_data.get('total_posts', 0)),
         ]
         
         for label, value in info_items:
-            ws[f'A{row}'] = label
-            ws[f'A{row}'].font = Font(name='微软雅黑', bold=True)
-            ws[f'B{row}'] = value
-            row += 1
+            ws.append([self._styled(ws, label, font=_FONT_LABEL), value])
         
         # 情感分布
-        row += 1
-        ws[f'A{row}'] = '情感分布'
-        ws[f'A{row}'].font = Font(name='微软雅黑', size=12, bold=True)
-        ws[f'A{row}'].fill = PatternFill(start_color='E8E8E8', end_color='E8E8E8', fill_type='solid')
-        ws.merge_cells(f'A{row}:D{row}')
+        ws.append([])
+        ws.append([self._styled(
+            ws, '情感分布',
+            font=_FONT_SECTION,
+            fill=_FILL_SECTION,
+        )])
+        ws.merged_cells.add('A8:D8')
         
-        row += 1
         dist = report_data.get('sentiment_distribution', {})
         sentiment_data = [
-            ('正面', dist.get('positive_count', 0), f"{dist.get('positive_ratio', 0) * 100:.1f}%", '22C55E'),
-            ('中性', dist.get('neutral_count', 0), f"{dist.get('neutral_ratio', 0) * 100:.1f}%", '3B82F6'),
-            ('负面', dist.get('negative_count', 0), f"{dist.get('negative_ratio', 0) * 100:.1f}%", 'EF4444'),
+            (*_SENTIMENT_BADGES['positive'], dist.get('positive_count', 0), f"{dist.get('positive_ratio', 0) * 100:.1f}%"),
+            (*_SENTIMENT_BADGES['neutral'], dist.get('neutral_count', 0), f"{dist.get('neutral_ratio', 0) * 100:.1f}%"),
+            (*_SENTIMENT_BADGES['negative'], dist.get('negative_count', 0), f"{dist.get('negative_ratio', 0) * 100:.1f}%"),
         ]
         
-        ws[f'A{row}'] = '情感'
-        ws[f'B{row}'] = '数量'
-        ws[f'C{row}'] = '占比'
-        for col in ['A', 'B', 'C']:
-            ws[f'{col}{row}'].font = Font(name='微软雅黑', bold=True)
-            ws[f'{col}{row}'].fill = PatternFill(start_color='F0F0F0', end_color='F0F0F0', fill_type='solid')
-        
-        row += 1
-        for sentiment, count, ratio, color in sentiment_data:
-            ws[f'A{row}'] = sentiment
-            ws[f'B{row}'] = count
-            ws[f'C{row}'] = ratio
-            ws[f'A{row}'].fill = PatternFill(start_color=color, end_color=color, fill_type='solid')
-            ws[f'A{row}'].font = Font(color='FFFFFF', bold=True)
-            row += 1
+        ws.append([
+            self._styled(ws, header, font=_FONT_LABEL, fill=_FILL_HEADER_GRAY)
+            for header in ('情感', '数量', '占比')
+        ])
         
-        # 调整列宽
-        ws.column_dimensions['A'].width = 20
-        ws.column_dimensions['B'].width = 30
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
+        for sentiment, fill, count, ratio in sentiment_data:
+            ws.append([
+                self._styled(ws, sentiment, font=_FONT_WHITE_BOLD, fill=fill),
+                count,
+                ratio,
+            ])
     
     def _create_posts_sheet(self, report_data: dict):
         """创建帖子详情工作表"""
-        ws = self.wb.create_sheet("📝 帖子详情")
-        
-        # 表头
-        headers = ['序号', '标题', '内容摘要', '情感', '点赞数', '评论数', '关键词']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = Font(name='微软雅黑', bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+        ws = self._start_sheet(_POSTS_LAYOUT)
         
         # 数据行
         posts = report_data.get('posts', [])
-        sentiment_colors = {
-            'positive': '22C55E',
-            'neutral': '3B82F6',
-            'negative': 'EF4444',
-        }
-        sentiment_labels = {
-            'positive': '正面',
-            'neutral': '中性',
-            'negative': '负面',
-        }
+        sentiment_cells = self._badge_cells(ws, _SENTIMENT_BADGES)
+        default_cell = sentiment_cells['neutral']
         
-        for idx, post in enumerate(posts, 1):
-            row = idx + 1
-            ws.cell(row=row, column=1, value=idx)
-            ws.cell(row=row, column=2, value=post.get('title', ''))
-            ws.cell(row=row, column=3, value=post.get('content', '')[:100] + '...' if post.get('content') else '')
-            
-            # 情感标签
-            sentiment = post.get('sentiment', 'neutral')
-            sentiment_cell = ws.cell(row=row, column=4, value=sentiment_labels.get(sentiment, '中性'))
-            sentiment_cell.fill = PatternFill(
-                start_color=sentiment_colors.get(sentiment, '3B82F6'),
-                end_color=sentiment_colors.get(sentiment, '3B82F6'),
-                fill_type='solid'
-            )
-            sentiment_cell.font = Font(color='FFFFFF', bold=True)
-            sentiment_cell.alignment = Alignment(horizontal='center')
-            
-            ws.cell(row=row, column=5, value=post.get('likes', 0))
-            ws.cell(row=row, column=6, value=post.get('comments', 0))
-            ws.cell(row=row, column=7, value=', '.join(post.get('keywords', [])[:5]))
-        
-        # 调整列宽
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['B'].width = 40
-        ws.column_dimensions['C'].width = 50
-        ws.column_dimensions['D'].width = 12
-        ws.column_dimensions['E'].width = 12
-        ws.column_dimensions['F'].width = 12
-        ws.column_dimensions['G'].width = 30
-        
-        # 冻结首行
-        ws.freeze_panes = 'A2'
+        append = ws.append
+        for row in _post_rows(posts, sentiment_cells, default_cell):
+            append(row)
     
     def _create_sentiment_sheet(self, report_data: dict):
         """创建情感分析工作表"""
-        ws = self.wb.create_sheet("📈 情感分析")
-        
-        # 标题
-        ws['A1'] = '情感分布统计'
-        ws['A1'].font = Font(name='微软雅黑', size=14, bold=True)
-        ws['A1'].fill = PatternFill(start_color='E8E8E8', end_color='E8E8E8', fill_type='solid')
-        ws.merge_cells('A1:E1')
-        
-        # 表头
-        headers = ['情感类型', '数量', '占比', '占比（%）', '趋势']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=2, column=col_num)
-            cell.value = header
-            cell.font = Font(name='微软雅黑', bold=True)
-            cell.fill = PatternFill(start_color='F0F0F0', end_color='F0F0F0', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center')
+        ws = self._start_sheet(_SENTIMENT_LAYOUT)
         
         # 数据
         dist = report_data.get('sentiment_distribution', {})
-        total = report_data.get('total_posts', 1)
         
         data = [
-            ('正面 😊', dist.get('positive_count', 0), dist.get('positive_ratio', 0), '22C55E'),
-            ('中性 😐', dist.get('neutral_count', 0), dist.get('neutral_ratio', 0), '3B82F6'),
-            ('负面 😞', dist.get('negative_count', 0), dist.get('negative_ratio', 0), 'EF4444'),
+            ('正面 😊', dist.get('positive_count', 0), dist.get('positive_ratio', 0), _FONT_POSITIVE),
+            ('中性 😐', dist.get('neutral_count', 0), dist.get('neutral_ratio', 0), _FONT_NEUTRAL),
+            ('负面 😞', dist.get('negative_count', 0), dist.get('negative_ratio', 0), _FONT_NEGATIVE),
         ]
         
-        row = 3
-        for sentiment, count, ratio, color in data:
-            ws.cell(row=row, column=1, value=sentiment).font = Font(bold=True)
-            ws.cell(row=row, column=2, value=count).alignment = Alignment(horizontal='center')
-            ws.cell(row=row, column=3, value=f"{ratio:.2%}").alignment = Alignment(horizontal='center')
-            ws.cell(row=row, column=4, value=ratio * 100).alignment = Alignment(horizontal='center')
-            
-            # 趋势条
-            trend_cell = ws.cell(row=row, column=5)
-            trend_cell.value = '█' * int(ratio * 20)
-            trend_cell.font = Font(color=color)
-            
-            row += 1
-        
-        # 调整列宽
-        ws.column_dimensions['A'].width = 15
-        ws.column_dimensions['B'].width = 12
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 12
-        ws.column_dimensions['E'].width = 30
+        for sentiment, count, ratio, trend_font in data:
+            ws.append([
+                self._styled(ws, sentiment, font=_FONT_BOLD),
+                self._styled(ws, count, alignment=_ALIGN_H_CENTER),
+                self._styled(ws, f"{ratio:.2%}", alignment=_ALIGN_H_CENTER),
+                self._styled(ws, ratio * 100, alignment=_ALIGN_H_CENTER),
+                # 趋势条
+                self._styled(ws, '█' * int(ratio * 20), font=trend_font),
+            ])
     
     def _create_keywords_sheet(self, report_data: dict):
         """创建关键词工作表"""
-        ws = self.wb.create_sheet("🔥 热门关键词")
-        
-        # 表头
-        headers = ['排名', '关键词', '出现次数', '情感倾向']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = Font(name='微软雅黑', bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color='FF6B00', end_color='FF6B00', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center')
+        ws = self._start_sheet(_KEYWORDS_LAYOUT)
         
         # 数据
         keywords = report_data.get('top_keywords', [])
-        sentiment_colors = {
-            'positive': '22C55E',
-            'neutral': '3B82F6',
-            'negative': 'EF4444',
-        }
-        sentiment_labels = {
-            'positive': '正面',
-            'neutral': '中性',
-            'negative': '负面',
-        }
+        sentiment_cells = self._badge_cells(ws, _SENTIMENT_BADGES)
+        default_cell = sentiment_cells['neutral']
         
+        append = ws.append
+        styled = self._styled
+        badge = sentiment_cells.get
         for idx, kw in enumerate(keywords, 1):
-            row = idx + 1
-            ws.cell(row=row, column=1, value=idx).alignment = Alignment(horizontal='center')
-            ws.cell(row=row, column=2, value=kw.get('word', ''))
-            ws.cell(row=row, column=3, value=kw.get('count', 0)).alignment = Alignment(horizontal='center')
-            
-            sentiment = kw.get('sentiment', 'neutral')
-            sentiment_cell = ws.cell(row=row, column=4, value=sentiment_labels.get(sentiment, '中性'))
-            sentiment_cell.fill = PatternFill(
-                start_color=sentiment_colors.get(sentiment, '3B82F6'),
-                end_color=sentiment_colors.get(sentiment, '3B82F6'),
-                fill_type='solid'
-            )
-            sentiment_cell.font = Font(color='FFFFFF', bold=True)
-            sentiment_cell.alignment = Alignment(horizontal='center')
-        
-        # 调整列宽
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['B'].width = 25
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
-        
-        # 冻结首行
-        ws.freeze_panes = 'A2'
+            get = kw.get
+            append([
+                styled(ws, idx, alignment=_ALIGN_H_CENTER),
+                get('word', ''),
+                styled(ws, get('count', 0), alignment=_ALIGN_H_CENTER),
+                badge(get('sentiment', 'neutral'), default_cell),
+            ])
     
     def _create_alerts_sheet(self, report_data: dict):
         """创建风险预警工作表"""
-        ws = self.wb.create_sheet("⚠️ 风险预警")
-        
-        # 表头
-        headers = ['风险等级', '预警描述']
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = Font(name='微软雅黑', bold=True, color='FFFFFF')
-            cell.fill = PatternFill(start_color='DC2626', end_color='DC2626', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center')
+        ws = self._start_sheet(_ALERTS_LAYOUT)
         
         # 数据
         alerts = report_data.get('risk_alerts', [])
-        level_colors = {
-            'high': 'EF4444',
-            'medium': 'F59E0B',
-            'low': '3B82F6',
-        }
-        level_labels = {
-            'high': '🔴 高风险',
-            'medium': '🟡 中风险',
-            'low': '🔵 低风险',
-        }
+        level_cells = self._badge_cells(ws, _LEVEL_BADGES)
+        default_cell = level_cells['low']
         
-        for idx, alert in enumerate(alerts, 1):
-            row = idx + 1
-            level = alert.get('level', 'low')
-            
-            level_cell = ws.cell(row=row, column=1, value=level_labels.get(level, '🔵 低风险'))
-            level_cell.fill = PatternFill(
-                start_color=level_colors.get(level, '3B82F6'),
-                end_color=level_colors.get(level, '3B82F6'),
-                fill_type='solid'
-            )
-            level_cell.font = Font(color='FFFFFF', bold=True)
-            level_cell.alignment = Alignment(horizontal='center')
-            
-            ws.cell(row=row, column=2, value=alert.get('description', ''))
+        append = ws.append
+        badge = level_cells.get
+        for alert in alerts:
+            get = alert.get
+            append([
+                badge(get('level', 'low'), default_cell),
+                get('description', ''),
+            ])
+
+
+def _post_rows(posts: List[dict], badges: dict, default_badge) -> Iterator[tuple]:
+    """
+    将帖子列表逐条转换为帖子详情表的数据行
+    
+    每行字段一次取出并拼成元组，调用方直接 append，不经过逐单元格写入。
+    
+    Args:
+        posts: 帖子字典列表
+        badges: 情感 -> 预先构造好的情感标签单元格
+        default_badge: 未知情感使用的标签单元格
         
-        # 调整列宽
-        ws.column_dimensions['A'].width = 15
-        ws.column_dimensions['B'].width = 80
+    Returns:
+        Iterator[tuple]: 与表头列顺序一致的数据行
+    """
+    # 循环内用到的方法预先绑定为局部变量，减少逐行的属性查找
+    badge = badges.get
+    join = ', '.join
+    for idx, post in enumerate(posts, 1):
+        get = post.get
+        content = get('content')
+        yield (
+            idx,
+            get('title', ''),
+            content[:100] + '...' if content else '',
+            # 情感标签
+            badge(get('sentiment', 'neutral'), default_badge),
+            get('likes', 0),
+            get('comments', 0),
+            join(get('keywords', ())[:5]),
+        )
 
 
 def get_excel_exporter() -> ExcelExporter:
@@ -3,18 +3,48 @@
 使用豆包 (Doubao) API 多模态能力识别小红书截图中的帖子内容
 """
 from __future__ import annotations
+import asyncio
 import httpx
 import base64
+import hashlib
 import json
 import logging
 import os
-from typing import Dict, Any, Optional
+import orjson
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Tuple, Union
+from PIL import Image, UnidentifiedImageError
+from services.cache import create_result_cache
+from services.doubao_api import (
+    DOUBAO_API_URL,
+    DOUBAO_MODEL,
+    extract_output_text,
+    get_client,
+    strip_fences
+)
 
 logger = logging.getLogger(__name__)
 
-# 豆包 API 配置
-DOUBAO_API_URL = "https://ark.cn-beijing.volces.com/api/v3/responses"
-DOUBAO_MODEL = "doubao-seed-1-8-251228"
+# 发送给豆包前的截图压缩配置：最长边像素上限、JPEG 质量，
+# 以及免压缩的体积阈值（尺寸和体积都不超限的截图原样发送）
+VLM_MAX_EDGE = 1600
+VLM_JPEG_QUALITY = 85
+VLM_MIN_COMPRESS_BYTES = 512 * 1024
+
+# 图像识别并发上限（同一分析器实例上所有请求共享），避免对豆包 API 造成过大压力
+ANALYZE_CONCURRENCY = int(os.getenv("ANALYZE_CONCURRENCY", "5"))
+# 单次豆包 API 调用最多携带的截图数量
+IMAGES_PER_CALL = int(os.getenv("IMAGES_PER_CALL", "10"))
+
+# 识别结果缓存配置（条目数为 0 时禁用缓存）
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "3600"))
+# 配置后识别结果改存 Redis，默认保留 7 天
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_CACHE_TTL = float(os.getenv("REDIS_CACHE_TTL", str(7 * 24 * 3600)))
+# 修改提示词或结果格式时递增，使旧的缓存结果失效
+PROMPT_VERSION = "v2"
 
 # 用于提取小红书截图中文字信息的提示词
 EXTRACTION_PROMPT = """
@@ -86,6 +116,20 @@ EXTRACTION_PROMPT = """
 请只返回 JSON 格式的结果，不要有其他文字。
 """
 
+# 多张截图合并为一次请求时使用的提示词
+BATCH_EXTRACTION_PROMPT = """
+以上共有 {count} 张小红书截图，请按顺序逐张分析。每张截图的识别规则和输出格式如下：
+
+{extraction_prompt}
+
+**批量输出要求：**
+- 返回一个 JSON 数组，数组长度必须为 {count}
+- 数组中第 i 个元素对应第 i 张截图，格式与上面单张截图的 JSON 结果完全一致
+- 即使某张截图无法识别，也要在对应位置返回一个对象（可在 notes 中说明原因）
+
+请只返回 JSON 数组，不要有其他文字。
+"""
+
 
 class ImageAnalyzer:
     """
@@ -103,113 +147,148 @@ class ImageAnalyzer:
         self.api_key = api_key or os.getenv("DOUBAO_API_KEY")
         if not self.api_key:
             raise ValueError("未配置 DOUBAO_API_KEY")
+        
+        # 以图片内容摘要为键缓存识别结果，重复上传的截图无需再次调用 API
+        self._cache = create_result_cache(
+            maxsize=IMAGE_CACHE_SIZE,
+            ttl=IMAGE_CACHE_TTL,
+            redis_url=REDIS_URL,
+            redis_ttl=REDIS_CACHE_TTL
+        )
+        
+        # 所有豆包 API 调用共用的信号量：分析器按 API Key 单例化，
+        # 并发上传的多个请求合计不超过 ANALYZE_CONCURRENCY 个调用，而不是每个请求各自限流
+        self._semaphore = asyncio.Semaphore(ANALYZE_CONCURRENCY)
     
-    async def analyze_image(self, image_data: bytes, mime_type: str = "image/png") -> Dict[str, Any]:
+    async def _call_api(self, content: List[Dict[str, Any]]) -> str:
+        """
+        调用豆包 API 并提取模型输出的文本
+        
+        Args:
+            content: 用户消息的内容片段列表（图片、文本）
+            
+        Returns:
+            去除 markdown 代码块标记后的响应文本
+        """
+        # 构建豆包 API 请求
+        payload = {
+            "model": DOUBAO_MODEL,
+            "input": [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        }
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # 请求体中包含 base64 图片，用 orjson 预先序列化，避免 httpx 用标准库 json 再扫描一遍
+        body = orjson.dumps(payload)
+        
+        # 发送请求（增加超时时间以处理大图片）
+        logger.info("正在调用豆包 API...")
+        # 复用模块级连接池，避免每次请求重新建立 TCP/TLS 连接
+        response = await get_client().post(
+            DOUBAO_API_URL,
+            content=body,
+            headers=headers
+        )
+        response.raise_for_status()
+        result = orjson.loads(response.content)
+        logger.info(f"豆包 API 响应成功: {list(result.keys())}")
+        
+        # 调试日志需要序列化整个响应，仅在 DEBUG 级别下执行
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("豆包 API 完整响应: %s", orjson.dumps(result)[:2000].decode("utf-8", "replace"))
+        
+        response_text = extract_output_text(result)
+        
+        if not response_text:
+            logger.warning(f"无法解析豆包 API 响应，完整结果: {result}")
+            response_text = orjson.dumps(result).decode("utf-8")
+        
+        if debug:
+            logger.debug("AI 原始响应 (前500字符): %s", response_text[:500])
+        
+        # 移除可能存在的 markdown 代码块标记
+        return strip_fences(response_text)
+    
+    async def analyze_image(
+        self,
+        image_data: bytes,
+        mime_type: str = "image/png",
+        prompt: str = EXTRACTION_PROMPT
+    ) -> Dict[str, Any]:
         """
         分析小红书截图，提取帖子信息
         
         Args:
             image_data: 图片的二进制数据
             mime_type: 图片的 MIME 类型
+            prompt: 识别提示词，默认为详情页/信息流通用的 EXTRACTION_PROMPT
             
         Returns:
             包含提取的帖子信息的字典
         """
+        cache_key = _cache_key(image_data, prompt)
+        cached = await self._cache.aget(cache_key)
+        if cached is not None:
+            logger.info("命中图像识别缓存，跳过豆包 API 调用")
+            return orjson.loads(cached)
+        
+        result = await self._analyze_image_uncached(image_data, mime_type, prompt)
+        if "error" not in result:
+            await self._store_result(cache_key, result)
+        return result
+    
+    async def _store_result(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """
+        写入识别结果缓存
+        
+        统一存为 orjson 序列化后的 bytes（与 Redis 读回的类型一致），单张与批量识别都经由此处写入
+        """
+        await self._cache.aset(cache_key, orjson.dumps(result))
+    
+    async def _analyze_image_uncached(
+        self,
+        image_data: bytes,
+        mime_type: str,
+        prompt: str
+    ) -> Dict[str, Any]:
+        """
+        调用豆包 API 识别单张截图（不经过缓存）
+        
+        Returns:
+            识别结果字典；响应无法解析时包含 error 字段
+        """
         try:
-            # 将图片数据编码为 base64 data URL
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            data_url = f"data:{mime_type};base64,{image_base64}"
-            
-            # 构建豆包 API 请求
-            payload = {
-                "model": DOUBAO_MODEL,
-                "input": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "input_image",
-                                "image_url": data_url
-                            },
-                            {
-                                "type": "input_text",
-                                "text": EXTRACTION_PROMPT
-                            }
-                        ]
-                    }
-                ]
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # 发送请求（增加超时时间以处理大图片）
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                logger.info("正在调用豆包 API...")
-                response = await client.post(
-                    DOUBAO_API_URL,
-                    json=payload,
-                    headers=headers
-                )
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"豆包 API 响应成功: {list(result.keys())}")
-            
-            # 解析响应 - 豆包 API 响应格式
-            # 实际响应结构: { "output": [ { "type": "message", "content": [ { "type": "output_text", "text": "..." } ] } ] }
-            logger.info(f"豆包 API 完整响应: {json.dumps(result, ensure_ascii=False)[:2000]}")
-            
-            response_text = ""
-            if "output" in result:
-                output = result["output"]
-                logger.info(f"output 字段类型: {type(output)}")
-                
-                # output 是数组格式
-                if isinstance(output, list):
-                    for item in output:
-                        if isinstance(item, dict) and item.get("type") == "message":
-                            content = item.get("content", [])
-                            if isinstance(content, list):
-                                for c in content:
-                                    if isinstance(c, dict) and c.get("type") == "output_text":
-                                        response_text = c.get("text", "")
-                                        break
-                            elif isinstance(content, str):
-                                response_text = content
-                            break
-                # output 是 dict 格式（旧格式兼容）
-                elif isinstance(output, dict) and "content" in output:
-                    response_text = output["content"]
-                elif isinstance(output, str):
-                    response_text = output
-            elif "choices" in result:
-                # 兼容 OpenAI 格式的响应
-                choices = result["choices"]
-                if choices and len(choices) > 0:
-                    message = choices[0].get("message", {})
-                    response_text = message.get("content", "")
-            
-            if not response_text:
-                logger.warning(f"无法解析豆包 API 响应，完整结果: {result}")
-                response_text = json.dumps(result)
-            
-            logger.info(f"AI 原始响应 (前500字符): {response_text[:500]}")
-            response_text = response_text.strip()
-            
-            # 移除可能存在的 markdown 代码块标记
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
+            image_data, mime_type = await asyncio.to_thread(resize_for_vlm, image_data, mime_type)
+            response_text = await self._call_api([
+                {
+                    "type": "input_image",
+                    "image_url": _to_data_url(image_data, mime_type)
+                },
+                {
+                    "type": "input_text",
+                    "text": prompt
+                }
+            ])
             
-            parsed_result = json.loads(response_text.strip())
+            parsed_result = orjson.loads(response_text)
             
-            logger.info(f"成功识别 {len(parsed_result.get('posts', []))} 个帖子")
-            logger.info(f"识别结果: {parsed_result}")
+            logger.info(
+                "识别完成: %s，帖子主体%s，评论 %d 条",
+                parsed_result.get("screenshot_type", "unknown"),
+                "已识别" if parsed_result.get("post_content") else "未识别",
+                len(parsed_result.get("comments") or [])
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("识别结果: %s", parsed_result)
             return parsed_result
             
         except json.JSONDecodeError as e:
@@ -225,17 +304,225 @@ class ImageAnalyzer:
         except Exception as e:
             logger.error(f"图像分析失败: {e}")
             raise
+    
+    async def analyze_images(
+        self,
+        images: List[Tuple[bytes, str]],
+        prompt: str = EXTRACTION_PROMPT
+    ) -> List[Union[Dict[str, Any], BaseException]]:
+        """
+        并发识别多张截图
+        
+        截图按 IMAGES_PER_CALL 分组，每组合并为一次豆包 API 调用并发执行；
+        所有豆包 API 调用（包括批量结果无法对应时的逐张识别）与其他请求共用分析器的信号量限流。
+        
+        Args:
+            images: (图片二进制数据, MIME 类型) 列表
+            prompt: 单张截图的识别提示词
+            
+        Returns:
+            与输入顺序一致的结果列表；识别失败的截图对应位置为异常对象
+        """
+        batches = [
+            images[start:start + IMAGES_PER_CALL]
+            for start in range(0, len(images), IMAGES_PER_CALL)
+        ]
+        
+        batch_results = await asyncio.gather(
+            *(
+                self.analyze_images_batch(
+                    [image_data for image_data, _ in batch],
+                    [mime_type for _, mime_type in batch],
+                    prompt
+                )
+                for batch in batches
+            ),
+            return_exceptions=True
+        )
+        
+        results: List[Union[Dict[str, Any], BaseException]] = []
+        for batch, batch_result in zip(batches, batch_results):
+            if isinstance(batch_result, BaseException):
+                results.extend([batch_result] * len(batch))
+            else:
+                results.extend(batch_result)
+        return results
+    
+    async def analyze_images_batch(
+        self,
+        images_data: List[bytes],
+        mime_types: List[str],
+        prompt: str = EXTRACTION_PROMPT
+    ) -> List[Dict[str, Any]]:
+        """
+        在一次豆包 API 调用中分析多张截图
+        
+        多张图片共享同一份提示词和同一次网络往返；若模型返回的结果
+        无法与图片一一对应，则退回到逐张分析。
+        
+        Args:
+            images_data: 图片二进制数据列表
+            mime_types: 与图片一一对应的 MIME 类型列表
+            prompt: 单张截图的识别提示词
+            
+        Returns:
+            与输入顺序一致的识别结果列表，每项格式与 analyze_image 相同
+        """
+        # 已缓存的截图直接复用结果，只把未命中的截图发给豆包 API
+        cache_keys = [_cache_key(image_data, prompt) for image_data in images_data]
+        cached_values = await asyncio.gather(*(self._cache.aget(cache_key) for cache_key in cache_keys))
+        results: List[Optional[Dict[str, Any]]] = [
+            orjson.loads(cached) if cached is not None else None
+            for cached in cached_values
+        ]
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) < len(results):
+            logger.info("图像识别缓存命中 %d/%d 张截图", len(results) - len(missing), len(results))
+        if missing:
+            fresh_results = await self._analyze_batch_uncached(
+                [images_data[i] for i in missing],
+                [mime_types[i] for i in missing],
+                prompt
+            )
+            for i, result in zip(missing, fresh_results):
+                results[i] = result
+                if "error" not in result:
+                    await self._store_result(cache_keys[i], result)
+        
+        return results
+    
+    async def _analyze_batch_uncached(
+        self,
+        images_data: List[bytes],
+        mime_types: List[str],
+        prompt: str
+    ) -> List[Dict[str, Any]]:
+        """
+        将多张截图合并为一次豆包 API 请求进行识别（不经过缓存，由调用方统一写入）
+        
+        每次豆包 API 调用都在分析器的信号量内进行，逐张识别的回退调用同样受其限制。
+        """
+        semaphore = self._semaphore
+        
+        async def analyze_one(image_data: bytes, mime_type: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._analyze_image_uncached(image_data, mime_type, prompt)
+        
+        if len(images_data) == 1:
+            return [await analyze_one(images_data[0], mime_types[0])]
+        
+        resized = await asyncio.gather(*(
+            asyncio.to_thread(resize_for_vlm, image_data, mime_type)
+            for image_data, mime_type in zip(images_data, mime_types)
+        ))
+        
+        content: List[Dict[str, Any]] = []
+        for idx, (image_data, mime_type) in enumerate(resized, 1):
+            content.append({"type": "input_text", "text": f"第 {idx} 张截图："})
+            content.append({"type": "input_image", "image_url": _to_data_url(image_data, mime_type)})
+        content.append({
+            "type": "input_text",
+            "text": BATCH_EXTRACTION_PROMPT.format(
+                count=len(images_data),
+                extraction_prompt=prompt
+            )
+        })
+        
+        try:
+            async with semaphore:
+                response_text = await self._call_api(content)
+            parsed_results = orjson.loads(response_text)
+            if isinstance(parsed_results, list) and len(parsed_results) == len(images_data) \
+                    and all(isinstance(r, dict) for r in parsed_results):
+                logger.info("批量识别完成，共 %d 张截图", len(parsed_results))
+                return parsed_results
+            logger.warning("批量识别结果与截图数量不一致，改为逐张识别")
+        except json.JSONDecodeError as e:
+            logger.warning("解析批量识别响应失败，改为逐张识别: %s", e)
+        except httpx.HTTPStatusError as e:
+            logger.error("豆包 API 请求失败: %d - %s", e.response.status_code, e.response.text)
+            raise
+        
+        return list(await asyncio.gather(*(
+            analyze_one(image_data, mime_type)
+            for image_data, mime_type in zip(images_data, mime_types)
+        )))
+
+
+def resize_for_vlm(image_data: bytes, mime_type: str) -> tuple[bytes, str]:
+    """
+    缩小过大的截图并重新编码为 JPEG，减少发送给豆包的图像 token 和上传体积
+    
+    Args:
+        image_data: 图片的二进制数据
+        mime_type: 图片的 MIME 类型
+        
+    Returns:
+        (处理后的图片数据, MIME 类型)；最长边不超过 VLM_MAX_EDGE 且体积不超过
+        VLM_MIN_COMPRESS_BYTES 的图片原样返回
+    """
+    try:
+        # Image.open 只解析文件头，未超限时不会解码像素
+        image = Image.open(BytesIO(image_data))
+        oversized = max(image.size) > VLM_MAX_EDGE
+        if not oversized and len(image_data) <= VLM_MIN_COMPRESS_BYTES:
+            return image_data, mime_type
+        
+        if oversized:
+            image.thumbnail((VLM_MAX_EDGE, VLM_MAX_EDGE), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        _flatten_to_rgb(image).save(output, format="JPEG", quality=VLM_JPEG_QUALITY, optimize=True)
+        compressed = output.getvalue()
+        
+        # 未缩放且重新编码后反而更大时，保留原图
+        if not oversized and len(compressed) >= len(image_data):
+            return image_data, mime_type
+        
+        logger.info(
+            "截图已压缩: %d KB -> %d KB (%dx%d)",
+            len(image_data) // 1024, len(compressed) // 1024, *image.size
+        )
+        return compressed, "image/jpeg"
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("图片压缩失败，使用原图: %s", e)
+        return image_data, mime_type
+
+
+def _flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """
+    转为 JPEG 可用的 RGB 图像；带透明通道的图片先铺到白色背景上，
+    避免透明区域直接丢弃 alpha 后变成黑色（深色文字随之不可辨认）
+    """
+    if image.mode not in ("RGBA", "LA", "PA") and "transparency" not in image.info:
+        return image.convert("RGB")
+    rgba = image.convert("RGBA")
+    background = Image.new("RGB", rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+    return background
+
+
+def _cache_key(image_data: bytes, prompt: str) -> str:
+    """
+    生成识别结果的缓存键
+    
+    由模型名、提示词版本以及图片内容与提示词的 SHA-256 摘要组成，
+    更换模型或提示词后不会命中旧结果。
+    """
+    digest = hashlib.sha256(image_data)
+    digest.update(prompt.encode("utf-8"))
+    return f"doubao:{DOUBAO_MODEL}:{PROMPT_VERSION}:{digest.hexdigest()}"
 
 
-# 全局分析器实例（延迟初始化）
-_analyzer: Optional[ImageAnalyzer] = None
+def _to_data_url(image_data: bytes, mime_type: str) -> str:
+    """将图片数据编码为 base64 data URL（在 bytes 上拼接，只解码一次）"""
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    return (prefix + base64.b64encode(image_data)).decode("ascii")
 
 
+@lru_cache(maxsize=None)
 def get_image_analyzer(api_key: Optional[str] = None) -> ImageAnalyzer:
     """
-    获取图像分析器实例（单例模式）
+    获取图像分析器实例（单例模式，首次调用时创建，之后直接返回缓存的实例）
     """
-    global _analyzer
-    if _analyzer is None:
-        _analyzer = ImageAnalyzer(api_key)
-    return _analyzer
+    return ImageAnalyzer(api_key)
@@ -3,28 +3,54 @@
 整合分析结果生成舆情分析报告
 """
 from __future__ import annotations
-import httpx
-import json
+import asyncio
 import logging
 import os
-import uuid
-from datetime import datetime
+import secrets
+import time
+import orjson
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Dict, Any, Optional
 from schema.response import (
     AnalysisReport,
     PostInfo,
     CommentInfo,
+    CommentReply,
     SentimentDistribution,
     KeywordInfo,
     RiskAlert,
     SentimentType
 )
+from services.cache import create_result_cache
+from services.doubao_api import (
+    call_doubao,
+    prompt_cache_key,
+    strip_fences,
+    to_int,
+    to_sentiment,
+    to_str_list
+)
 
 logger = logging.getLogger(__name__)
 
-# 豆包 API 配置
-DOUBAO_API_URL = "https://ark.cn-beijing.volces.com/api/v3/responses"
-DOUBAO_MODEL = "doubao-seed-1-8-251228"
+# 洞察结果缓存：最多缓存条数（0 表示禁用）和有效期（秒）；配置 REDIS_URL 后改存 Redis
+INSIGHTS_CACHE_SIZE = int(os.getenv("INSIGHTS_CACHE_SIZE", "256"))
+INSIGHTS_CACHE_TTL = float(os.getenv("INSIGHTS_CACHE_TTL", "86400"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+# 报告生成时间格式（本地时间，ISO 8601 精确到秒）
+CREATED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# 关键词、风险预警的字段读取器及缺省值：字段齐全时直接按键取值，缺字段时才合并缺省值
+_keyword_fields = itemgetter("word", "count", "sentiment")
+_KEYWORD_DEFAULTS = {"word": "", "count": 1, "sentiment": "neutral"}
+_alert_fields = itemgetter("level", "description", "related_posts")
+_ALERT_DEFAULTS = {"level": "low", "description": "", "related_posts": []}
+
+# 洞察提示词中单条帖子摘要的格式
+_format_summary_line = "- [{}] {}...".format
 
 # 洞察生成提示词
 INSIGHTS_PROMPT = """
@@ -73,67 +99,13 @@ class ReportGenerator:
         self.api_key = api_key or os.getenv("DOUBAO_API_KEY")
         if not self.api_key:
             raise ValueError("未配置 DOUBAO_API_KEY")
-    
-    async def _call_doubao_api(self, prompt: str) -> str:
-        """
-        调用豆包 API
-        """
-        payload = {
-            "model": DOUBAO_MODEL,
-            "input": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": prompt
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            response = await client.post(
-                DOUBAO_API_URL,
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            result = response.json()
-        
-        # 解析响应 - output 是数组格式
-        response_text = ""
-        if "output" in result:
-            output = result["output"]
-            if isinstance(output, list):
-                for item in output:
-                    if isinstance(item, dict) and item.get("type") == "message":
-                        content = item.get("content", [])
-                        if isinstance(content, list):
-                            for c in content:
-                                if isinstance(c, dict) and c.get("type") == "output_text":
-                                    response_text = c.get("text", "")
-                                    break
-                        elif isinstance(content, str):
-                            response_text = content
-                        break
-            elif isinstance(output, dict) and "content" in output:
-                response_text = output["content"]
-            elif isinstance(output, str):
-                response_text = output
-        elif "choices" in result:
-            choices = result["choices"]
-            if choices and len(choices) > 0:
-                message = choices[0].get("message", {})
-                response_text = message.get("content", "")
         
-        return response_text
+        # 以提示词摘要为键缓存洞察结果，相同的分析数据再次生成报告时无需调用 API
+        self._cache = create_result_cache(
+            maxsize=INSIGHTS_CACHE_SIZE,
+            ttl=INSIGHTS_CACHE_TTL,
+            redis_url=REDIS_URL
+        )
     
     def calculate_sentiment_distribution(
         self, 
@@ -152,17 +124,20 @@ class ReportGenerator:
         if total == 0:
             return SentimentDistribution()
         
-        positive_count = sum(1 for p in posts if p.sentiment == SentimentType.POSITIVE)
-        negative_count = sum(1 for p in posts if p.sentiment == SentimentType.NEGATIVE)
-        neutral_count = sum(1 for p in posts if p.sentiment == SentimentType.NEUTRAL)
+        # 单次遍历统计各情感类型数量
+        counts = Counter(p.sentiment for p in posts)
+        positive_count = counts[SentimentType.POSITIVE]
+        negative_count = counts[SentimentType.NEGATIVE]
+        neutral_count = counts[SentimentType.NEUTRAL]
+        inv_total = 1.0 / total
         
         return SentimentDistribution(
             positive_count=positive_count,
             negative_count=negative_count,
             neutral_count=neutral_count,
-            positive_ratio=positive_count / total,
-            negative_ratio=negative_count / total,
-            neutral_ratio=neutral_count / total
+            positive_ratio=positive_count * inv_total,
+            negative_ratio=negative_count * inv_total,
+            neutral_ratio=neutral_count * inv_total
         )
     
     def parse_keywords(self, keywords_data: List[Dict[str, Any]]) -> List[KeywordInfo]:
@@ -176,22 +151,24 @@ class ReportGenerator:
             KeywordInfo 列表
         """
         result = []
+        construct = KeywordInfo.model_construct
+        
+        # 字段在此处整理为合法的类型，跳过 pydantic 校验直接构造
         for kw in keywords_data[:10]:  # 最多取前 10 个
             try:
-                sentiment_str = kw.get("sentiment", "neutral")
-                try:
-                    sentiment = SentimentType(sentiment_str)
-                except ValueError:
-                    sentiment = SentimentType.NEUTRAL
-                
-                result.append(KeywordInfo(
-                    word=kw.get("word", ""),
-                    count=kw.get("count", 1),
-                    sentiment=sentiment
-                ))
-            except Exception as e:
-                logger.warning(f"解析关键词失败: {e}")
+                word, count, sentiment = _keyword_fields(kw)
+            except KeyError:
+                # 缺少字段时用缺省值补齐
+                word, count, sentiment = _keyword_fields({**_KEYWORD_DEFAULTS, **kw})
+            except TypeError:
+                logger.warning(f"解析关键词失败: {kw!r}")
                 continue
+            count = to_int(count)
+            result.append(construct(
+                word=str(word or ""),
+                count=1 if count is None else count,
+                sentiment=to_sentiment(sentiment)
+            ))
         
         return result
     
@@ -206,16 +183,23 @@ class ReportGenerator:
             RiskAlert 列表
         """
         result = []
+        construct = RiskAlert.model_construct
+        
+        # 字段在此处整理为合法的类型，跳过 pydantic 校验直接构造
         for alert in alerts_data:
             try:
-                result.append(RiskAlert(
-                    level=alert.get("level", "low"),
-                    description=alert.get("description", ""),
-                    related_posts=alert.get("related_posts", [])
-                ))
-            except Exception as e:
-                logger.warning(f"解析风险预警失败: {e}")
+                level, description, related_posts = _alert_fields(alert)
+            except KeyError:
+                # 缺少字段时用缺省值补齐
+                level, description, related_posts = _alert_fields({**_ALERT_DEFAULTS, **alert})
+            except TypeError:
+                logger.warning(f"解析风险预警失败: {alert!r}")
                 continue
+            result.append(construct(
+                level=str(level or "low"),
+                description=str(description or ""),
+                related_posts=to_str_list(related_posts)
+            ))
         
         return result
     
@@ -240,13 +224,13 @@ class ReportGenerator:
         """
         try:
             # 准备帖子摘要
-            posts_summary = "\n".join([
-                f"- [{p.sentiment.value}] {p.title[:50]}..." 
+            posts_summary = "\n".join(
+                _format_summary_line(p.sentiment.value, p.title[:50])
                 for p in posts[:10]  # 最多展示 10 条
-            ])
+            )
             
             # 准备关键词列表
-            top_keywords = ", ".join([kw.word for kw in keywords[:5]])
+            top_keywords = ", ".join(kw.word for kw in keywords[:5])
             
             prompt = INSIGHTS_PROMPT.format(
                 total_posts=len(posts),
@@ -258,18 +242,22 @@ class ReportGenerator:
                 posts_summary=posts_summary
             )
             
-            response_text = await self._call_doubao_api(prompt)
-            response_text = response_text.strip()
+            cache_key = prompt_cache_key("insights", prompt)
+            cached = await self._cache.aget(cache_key)
+            if cached is not None:
+                logger.info("命中洞察缓存，跳过豆包 API 调用")
+                return orjson.loads(cached)
             
-            # 移除可能存在的 markdown 代码块标记
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
+            response_text = await call_doubao(prompt, self.api_key)
             
-            return json.loads(response_text.strip())
+            # 移除可能存在的 markdown 代码块标记及首尾空白
+            response_text = strip_fences(response_text)
+            insights_data = orjson.loads(response_text)
+            if not isinstance(insights_data, dict):
+                raise ValueError(f"响应不是 JSON 对象: {type(insights_data).__name__}")
+            # 只缓存结构正确的结果，避免异常响应在有效期内被反复复用
+            await self._cache.aset(cache_key, response_text)
+            return insights_data
             
         except Exception as e:
             logger.error(f"生成洞察失败: {e}")
@@ -301,7 +289,8 @@ class ReportGenerator:
             完整的分析报告
         """
         # 生成分析 ID
-        analysis_id = str(uuid.uuid4())[:8]
+        # 毫秒时间戳（十六进制，便于按时间排序）加 2 字节随机数
+        analysis_id = f"{int(time.time() * 1000):x}{secrets.token_hex(2)}"
         
         # 计算情感分布
         sentiment_dist = self.calculate_sentiment_distribution(posts)
@@ -310,28 +299,38 @@ class ReportGenerator:
         keywords = self.parse_keywords(keywords_data)
         risk_alerts = self.parse_risk_alerts(risk_alerts_data)
         
+        # 洞察只依赖上面的统计结果，提前发起调用；让出一次事件循环使请求先发出，
+        # 等待模型响应期间再解析评论数据
+        insights_task = asyncio.create_task(self.generate_insights(
+            posts, sentiment_dist, keywords, risk_alerts
+        ))
+        await asyncio.sleep(0)
+        
         # 解析评论数据
         comments = []
         if comments_data:
+            append = comments.append
+            construct_comment = CommentInfo.model_construct
+            construct_reply = CommentReply.model_construct
             for comment_dict in comments_data:
                 try:
                     # 处理回复数据
                     replies_data = comment_dict.get("replies", [])
-                    from schema.response import CommentReply
                     replies = [
-                        CommentReply(
-                            author=reply.get("author", ""),
-                            content=reply.get("content", "")
+                        construct_reply(
+                            author=str(reply.get("author") or ""),
+                            content=str(reply.get("content") or "")
                         )
-                        for reply in replies_data
+                        for reply in replies_data or ()
                     ]
                     
-                    comments.append(CommentInfo(
-                        author=comment_dict.get("author", ""),
-                        content=comment_dict.get("content", ""),
-                        likes=comment_dict.get("likes"),
-                        time=comment_dict.get("time"),
-                        is_author_reply=comment_dict.get("is_author_reply", False),
+                    comment_time = comment_dict.get("time")
+                    append(construct_comment(
+                        author=str(comment_dict.get("author") or ""),
+                        content=str(comment_dict.get("content") or ""),
+                        likes=to_int(comment_dict.get("likes")),
+                        time=None if comment_time is None else str(comment_time),
+                        is_author_reply=bool(comment_dict.get("is_author_reply")),
                         replies=replies,
                         post_title=comment_dict.get("post_title"),
                         screenshot_index=comment_dict.get("screenshot_index")
@@ -340,13 +339,12 @@ class ReportGenerator:
                     logger.warning(f"解析评论数据失败: {e}")
                     continue
         
-        # 生成洞察和建议
-        insights_data = await self.generate_insights(
-            posts, sentiment_dist, keywords, risk_alerts
-        )
+        # 等待洞察和建议生成完成
+        insights_data = await insights_task
         
         # 构建报告
-        report = AnalysisReport(
+        # 各字段均已是合法的模型对象或基本类型，跳过 pydantic 校验直接构造
+        report = AnalysisReport.model_construct(
             analysis_id=analysis_id,
             search_keyword=search_keyword,
             total_posts=len(posts),
@@ -356,26 +354,19 @@ class ReportGenerator:
             posts=posts,
             comments=comments,
             risk_alerts=risk_alerts,
-            summary=insights_data.get("summary", ""),
-            insights=insights_data.get("insights", []),
-            recommendations=insights_data.get("recommendations", []),
-            created_at=datetime.now().isoformat()
+            summary=str(insights_data.get("summary") or ""),
+            insights=to_str_list(insights_data.get("insights")),
+            recommendations=to_str_list(insights_data.get("recommendations")),
+            created_at=time.strftime(CREATED_AT_FORMAT)
         )
         
         logger.info(f"报告生成完成，ID: {analysis_id}，包含 {len(posts)} 个帖子和 {len(comments)} 条评论")
         return report
 
 
-
-# 全局生成器实例
-_generator: Optional[ReportGenerator] = None
-
-
+@lru_cache(maxsize=None)
 def get_report_generator(api_key: Optional[str] = None) -> ReportGenerator:
     """
-    获取报告生成器实例（单例模式）
+    获取报告生成器实例（单例模式，首次调用时创建，之后直接返回缓存的实例）
     """
-    global _generator
-    if _generator is None:
-        _generator = ReportGenerator(api_key)
-    return _generator
+    return ReportGenerator(api_key)
@@ -3,18 +3,34 @@
 使用豆包 (Doubao) API 对帖子内容进行情感分析和关键词提取
 """
 from __future__ import annotations
-import httpx
-import json
+import asyncio
 import logging
 import os
+import orjson
+from collections import Counter
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from schema.response import SentimentType, PostInfo, KeywordInfo
+from services.cache import create_result_cache
+from services.doubao_api import (
+    call_doubao,
+    prompt_cache_key,
+    strip_fences,
+    to_int,
+    to_sentiment,
+    to_str_list
+)
 
 logger = logging.getLogger(__name__)
 
-# 豆包 API 配置
-DOUBAO_API_URL = "https://ark.cn-beijing.volces.com/api/v3/responses"
-DOUBAO_MODEL = "doubao-seed-1-8-251228"
+# 帖子较多时分批并发分析：每批帖子数和同时进行的请求数
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "10"))
+SENTIMENT_CONCURRENCY = int(os.getenv("SENTIMENT_CONCURRENCY", "8"))
+
+# 情感分析结果缓存：最多缓存条数（0 表示禁用）和有效期（秒）；配置 REDIS_URL 后改存 Redis
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "256"))
+SENTIMENT_CACHE_TTL = float(os.getenv("SENTIMENT_CACHE_TTL", "86400"))
+REDIS_URL = os.getenv("REDIS_URL")
 
 # 情感分析提示词
 SENTIMENT_PROMPT = """
@@ -64,6 +80,9 @@ SENTIMENT_PROMPT = """
 请只返回 JSON 格式的结果，不要有其他文字。
 """
 
+# 提示词在帖子数据前后的固定部分（已还原 {{ }} 转义），分批调用时直接拼接，无需每次解析模板
+_SENTIMENT_PROMPT_HEAD, _SENTIMENT_PROMPT_TAIL = SENTIMENT_PROMPT.format(posts_json="\0").split("\0")
+
 
 class SentimentAnalyzer:
     """
@@ -81,78 +100,21 @@ class SentimentAnalyzer:
         self.api_key = api_key or os.getenv("DOUBAO_API_KEY")
         if not self.api_key:
             raise ValueError("未配置 DOUBAO_API_KEY")
-    
-    async def _call_doubao_api(self, prompt: str) -> str:
-        """
-        调用豆包 API
-        
-        Args:
-            prompt: 提示词
-            
-        Returns:
-            API 响应文本
-        """
-        payload = {
-            "model": DOUBAO_MODEL,
-            "input": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": prompt
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            response = await client.post(
-                DOUBAO_API_URL,
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            result = response.json()
-        
-        # 解析响应 - output 是数组格式
-        response_text = ""
-        if "output" in result:
-            output = result["output"]
-            if isinstance(output, list):
-                for item in output:
-                    if isinstance(item, dict) and item.get("type") == "message":
-                        content = item.get("content", [])
-                        if isinstance(content, list):
-                            for c in content:
-                                if isinstance(c, dict) and c.get("type") == "output_text":
-                                    response_text = c.get("text", "")
-                                    break
-                        elif isinstance(content, str):
-                            response_text = content
-                        break
-            elif isinstance(output, dict) and "content" in output:
-                response_text = output["content"]
-            elif isinstance(output, str):
-                response_text = output
-        elif "choices" in result:
-            choices = result["choices"]
-            if choices and len(choices) > 0:
-                message = choices[0].get("message", {})
-                response_text = message.get("content", "")
         
-        return response_text
+        # 以提示词摘要为键缓存分析结果，相同的帖子再次分析时无需调用 API
+        self._cache = create_result_cache(
+            maxsize=SENTIMENT_CACHE_SIZE,
+            ttl=SENTIMENT_CACHE_TTL,
+            redis_url=REDIS_URL
+        )
     
     async def analyze_sentiment(self, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         对帖子列表进行情感分析
         
+        帖子数超过 SENTIMENT_BATCH_SIZE 时拆分为多批并发调用豆包 API，
+        再合并各批的分析结果；单批失败时其余批次的结果照常返回。
+        
         Args:
             posts: 帖子信息列表（来自图像识别结果）
             
@@ -168,29 +130,86 @@ class SentimentAnalyzer:
                 "sentiment_summary": "没有可分析的帖子内容"
             }
         
+        if len(posts) <= SENTIMENT_BATCH_SIZE:
+            return await self._analyze_batch(posts)
+        
+        batches = [
+            posts[start:start + SENTIMENT_BATCH_SIZE]
+            for start in range(0, len(posts), SENTIMENT_BATCH_SIZE)
+        ]
+        semaphore = asyncio.Semaphore(SENTIMENT_CONCURRENCY)
+        
+        async def analyze_batch(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._analyze_batch(batch)
+        
+        logger.info("共 %d 个帖子，分 %d 批进行情感分析", len(posts), len(batches))
+        results = await asyncio.gather(
+            *(analyze_batch(batch) for batch in batches),
+            return_exceptions=True
+        )
+        
+        succeeded = []
+        for idx, result in enumerate(results, 1):
+            if isinstance(result, BaseException):
+                logger.warning("第 %d 批情感分析失败，已跳过: %s", idx, result)
+            elif "error" in result:
+                logger.warning("第 %d 批情感分析结果无法解析，已跳过", idx)
+            else:
+                succeeded.append(result)
+        
+        if not succeeded:
+            # 全部批次失败：有异常时抛出第一个异常，否则返回解析失败的结果
+            logger.error("全部 %d 批情感分析均失败", len(results))
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return {**results[0], "error": f"全部 {len(results)} 批结果均无法解析: {results[0]['error']}"}
+        
+        if len(succeeded) < len(results):
+            logger.warning("%d/%d 批情感分析失败，仅合并其余批次的结果", len(results) - len(succeeded), len(results))
+        merged = _merge_sentiment_results(succeeded)
+        logger.info("情感分析完成，整体情感倾向: %s", merged["overall_sentiment"])
+        return merged
+    
+    async def _analyze_batch(self, posts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        在一次豆包 API 调用中分析一批帖子
+        
+        Args:
+            posts: 帖子信息列表
+            
+        Returns:
+            包含情感分析结果的字典；响应无法解析时包含 error 字段
+        """
         try:
             # 构建提示词
-            posts_json = json.dumps(posts, ensure_ascii=False, indent=2)
-            prompt = SENTIMENT_PROMPT.format(posts_json=posts_json)
+            # 紧凑序列化（无缩进），减少提示词的 token 数
+            posts_json = orjson.dumps(posts).decode("utf-8")
+            prompt = _SENTIMENT_PROMPT_HEAD + posts_json + _SENTIMENT_PROMPT_TAIL
             
-            # 调用豆包 API
-            response_text = await self._call_doubao_api(prompt)
-            response_text = response_text.strip()
+            cache_key = prompt_cache_key("sentiment", prompt)
+            cached = await self._cache.aget(cache_key)
+            if cached is not None:
+                logger.info("命中情感分析缓存，跳过豆包 API 调用")
+                return orjson.loads(cached)
             
-            # 移除可能存在的 markdown 代码块标记
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
+            # 调用豆包 API
+            response_text = await call_doubao(prompt, self.api_key)
             
-            result = json.loads(response_text.strip())
+            # 移除可能存在的 markdown 代码块标记及首尾空白
+            response_text = strip_fences(response_text)
+            result = orjson.loads(response_text)
+            if not isinstance(result, dict):
+                raise ValueError(f"响应不是 JSON 对象: {type(result).__name__}")
+            # 只缓存结构正确的结果，避免异常响应在有效期内被反复复用
+            await self._cache.aset(cache_key, response_text)
             
             logger.info(f"情感分析完成，整体情感倾向: {result.get('overall_sentiment')}")
             return result
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
+            # JSON 解析失败（JSONDecodeError 是 ValueError 的子类）或结构不符
             logger.error(f"解析情感分析响应失败: {e}")
             return {
                 "analyzed_posts": [],
@@ -220,48 +239,114 @@ class SentimentAnalyzer:
             合并后的 PostInfo 列表
         """
         result = []
+        append = result.append
+        construct = PostInfo.model_construct
         
         # 创建标题到分析结果的映射
         analysis_map = {
-            post.get("original_title", ""): post 
+            str(post.get("original_title") or ""): post
             for post in analyzed_posts
+            if isinstance(post, dict)
         }
         
         for original in original_posts:
-            title = original.get("title", "")
-            analysis = analysis_map.get(title, {})
-            
-            # 确定情感类型
-            sentiment_str = analysis.get("sentiment", "neutral")
-            try:
-                sentiment = SentimentType(sentiment_str)
-            except ValueError:
-                sentiment = SentimentType.NEUTRAL
+            get = original.get
+            title = str(get("title") or "")
+            analysis = analysis_map.get(title) or {}
             
-            post_info = PostInfo(
-                title=title or "",
-                content=original.get("content") or "",
-                author=original.get("author") or "",
-                likes=original.get("likes"),
-                comments=original.get("comments"),
-                sentiment=sentiment,
-                sentiment_score=analysis.get("sentiment_score", 0.0) or 0.0,
-                keywords=analysis.get("keywords") or []
-            )
-            result.append(post_info)
+            # 字段已在此处整理为合法的类型和取值，跳过 pydantic 校验直接构造
+            append(construct(
+                title=title,
+                content=str(get("content") or ""),
+                author=str(get("author") or ""),
+                likes=to_int(get("likes")),
+                comments=to_int(get("comments")),
+                sentiment=to_sentiment(analysis.get("sentiment")),
+                sentiment_score=_to_score(analysis.get("sentiment_score")),
+                keywords=to_str_list(analysis.get("keywords"))
+            ))
         
         return result
 
 
-# 全局分析器实例
-_analyzer: Optional[SentimentAnalyzer] = None
+def _to_score(value: Any) -> float:
+    """将情感得分转为 -1 到 1 之间的 float，无法转换时返回 0.0"""
+    try:
+        score = float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+    return min(1.0, max(-1.0, score))
+
+
+def _merge_sentiment_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    合并多批情感分析结果
+    
+    - analyzed_posts 依次拼接
+    - top_keywords 按词累加出现次数后取前 10 个，情感倾向取该词出现次数最多的批次
+    - risk_alerts 按 (等级, 描述) 去重
+    - overall_sentiment 由合并后各帖子的情感分布计算，不再额外调用模型
+    
+    Args:
+        results: 各批次的情感分析结果
+        
+    Returns:
+        与单批结果格式一致的字典
+    """
+    analyzed_posts: List[Dict[str, Any]] = []
+    keyword_counts: Counter = Counter()
+    keyword_sentiments: Dict[str, tuple] = {}
+    risk_alerts: List[Dict[str, Any]] = []
+    seen_alerts = set()
+    
+    for result in results:
+        analyzed_posts.extend(result.get("analyzed_posts") or [])
+        
+        for kw in result.get("top_keywords") or []:
+            if not isinstance(kw, dict):
+                continue
+            word = kw.get("word")
+            if not word:
+                continue
+            # 次数缺失、非整数或不为正时按出现 1 次计
+            count = kw.get("count")
+            if not isinstance(count, int) or count < 1:
+                count = 1
+            keyword_counts[word] += count
+            if count > keyword_sentiments.get(word, (0, None))[0]:
+                keyword_sentiments[word] = (count, kw.get("sentiment", "neutral"))
+        
+        for alert in result.get("risk_alerts") or []:
+            if not isinstance(alert, dict):
+                continue
+            alert_key = (alert.get("level"), alert.get("description"))
+            if alert_key not in seen_alerts:
+                seen_alerts.add(alert_key)
+                risk_alerts.append(alert)
+    
+    # 情感取值不是字符串（如列表）时按中性统计，避免不可哈希的值使 Counter 报错
+    sentiment_counts = Counter(
+        to_sentiment(post.get("sentiment")).value for post in analyzed_posts if isinstance(post, dict)
+    )
+    overall_sentiment = sentiment_counts.most_common(1)[0][0] if sentiment_counts else "neutral"
+    
+    return {
+        "analyzed_posts": analyzed_posts,
+        "top_keywords": [
+            {"word": word, "count": count, "sentiment": keyword_sentiments[word][1]}
+            for word, count in keyword_counts.most_common(10)
+        ],
+        "risk_alerts": risk_alerts,
+        "overall_sentiment": overall_sentiment,
+        "sentiment_summary": "\n".join(
+            result["sentiment_summary"] for result in results if result.get("sentiment_summary")
+        )
+    }
 
 
+@lru_cache(maxsize=None)
 def get_sentiment_analyzer(api_key: Optional[str] = None) -> SentimentAnalyzer:
     """
-    获取情感分析器实例（单例模式）
+    获取情感分析器实例（单例模式，首次调用时创建，之后直接返回缓存的实例）
     """
-    global _analyzer
-    if _analyzer is None:
-        _analyzer = SentimentAnalyzer(api_key)
-    return _analyzer
+    return SentimentAnalyzer(api_key)
@@ -0,0 +1,7 @@
+"""
+测试公共配置：将 backend 目录加入导入路径，与运行 main.py 时的模块布局一致
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,41 @@
+"""
+进程内结果缓存（TTLCache）的测试
+"""
+import asyncio
+
+from services import cache
+from services.cache import TTLCache, create_result_cache
+
+
+def test_get_set_and_lru_eviction():
+    lru = TTLCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1  # a 变为最近使用
+    lru.set("c", 3)
+    
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    ttl_cache = TTLCache(maxsize=4, ttl=10)
+    ttl_cache.set("k", "v")
+    
+    now[0] += 5
+    assert ttl_cache.get("k") == "v"
+    now[0] += 10
+    assert ttl_cache.get("k") is None
+
+
+def test_zero_size_disables_cache_and_async_api():
+    disabled = TTLCache(maxsize=0, ttl=60)
+    asyncio.run(disabled.aset("k", "v"))
+    assert asyncio.run(disabled.aget("k")) is None
+
+
+def test_factory_falls_back_to_memory_without_redis_url():
+    assert isinstance(create_result_cache(maxsize=1, ttl=1), TTLCache)
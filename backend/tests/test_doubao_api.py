@@ -0,0 +1,92 @@
+"""
+豆包 API 公共工具的测试
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from services import doubao_api
+from services.doubao_api import extract_output_text, post_with_retry, prompt_cache_key, strip_fences
+
+
+def test_extract_output_text_common_message():
+    result = {"output": [{"type": "message", "content": [{"type": "output_text", "text": "ok"}]}]}
+    assert extract_output_text(result) == "ok"
+
+
+def test_extract_output_text_skips_leading_reasoning():
+    result = {"output": [
+        {"type": "reasoning", "content": [{"type": "output_text", "text": "thinking"}]},
+        {"type": "message", "content": [{"type": "output_text", "text": "answer"}]}
+    ]}
+    assert extract_output_text(result) == "answer"
+
+
+def test_extract_output_text_legacy_formats():
+    assert extract_output_text({"output": "text"}) == "text"
+    assert extract_output_text({"output": {"content": "dict"}}) == "dict"
+    assert extract_output_text({"output": [{"type": "message", "content": "str"}]}) == "str"
+    assert extract_output_text({"choices": [{"message": {"content": "openai"}}]}) == "openai"
+    assert extract_output_text({}) == ""
+
+
+def test_extract_output_text_null_content():
+    assert extract_output_text({"output": [{"type": "message", "content": None}]}) == ""
+    assert extract_output_text({"output": [{"type": "message"}]}) == ""
+
+
+def test_strip_fences():
+    assert strip_fences('```json\n{"a": 1}\n```') == '{"a": 1}'
+    assert strip_fences('  ```\n[1]\n```  ') == "[1]"
+    assert strip_fences('\n{"a": "```"}\n') == '{"a": "```"}'
+
+
+def test_prompt_cache_key_is_namespaced_and_stable():
+    key = prompt_cache_key("sentiment", "prompt")
+    assert key.startswith("doubao:sentiment:")
+    assert key == prompt_cache_key("sentiment", "prompt")
+    assert key != prompt_cache_key("insights", "prompt")
+    assert key != prompt_cache_key("sentiment", "prompt2")
+
+
+def _post(handler):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await post_with_retry(client, "http://doubao.test/")
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(doubao_api, "RETRY_BACKOFF_BASE", 0.0)
+
+
+def test_post_with_retry_recovers_from_connect_error_and_503():
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        if len(calls) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"ok": True})
+    
+    assert _post(handler).status_code == 200
+    assert len(calls) == 3
+
+
+def test_post_with_retry_does_not_retry_read_timeout_or_client_errors():
+    calls = []
+    
+    def timeout_handler(request):
+        calls.append(request)
+        raise httpx.ReadTimeout("slow", request=request)
+    
+    with pytest.raises(httpx.ReadTimeout):
+        _post(timeout_handler)
+    assert len(calls) == 1
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        _post(lambda request: httpx.Response(400))
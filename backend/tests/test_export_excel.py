@@ -0,0 +1,36 @@
+"""
+Excel 导出接口的测试
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+def _export(body: str):
+    return client.post("/api/export/excel", content=body, headers={"Content-Type": "application/json"})
+
+
+@pytest.mark.parametrize("body", [
+    '{"posts": null}',
+    '{"posts": [1]}',
+    '{"top_keywords": {}}',
+    '{"sentiment_distribution": []}',
+    '{"posts": [{"title": "a", "content": 5}]}',
+    '[]',
+    'not json'
+])
+def test_malformed_report_is_rejected_with_400(body):
+    response = _export(body)
+    
+    assert response.status_code == 400
+    assert "报告数据" in response.json()["detail"]
+
+
+def test_valid_report_is_exported():
+    response = _export('{"posts": [{"title": "a", "content": "b", "keywords": ["k"]}]}')
+    
+    assert response.status_code == 200
+    assert response.content[:2] == b"PK"
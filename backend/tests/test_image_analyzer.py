@@ -0,0 +1,109 @@
+"""
+图像分析服务的测试
+"""
+import asyncio
+from io import BytesIO
+
+from PIL import Image
+
+from services import image_analyzer
+from services.image_analyzer import ImageAnalyzer, resize_for_vlm
+
+
+def test_fallback_calls_respect_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(image_analyzer, "ANALYZE_CONCURRENCY", 5)
+    analyzer = ImageAnalyzer(api_key="test-key")
+    active = 0
+    peak = 0
+    
+    async def fake_call_api(content):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        images = sum(1 for part in content if part["type"] == "input_image")
+        # 批量调用返回无法对应的结果，迫使逐张识别
+        return "[]" if images > 1 else '{"screenshot_type": "detail_view"}'
+    
+    monkeypatch.setattr(analyzer, "_call_api", fake_call_api)
+    monkeypatch.setattr(image_analyzer, "resize_for_vlm", lambda data, mime_type: (data, mime_type))
+    
+    images = [(bytes([i]) * 16, "image/png") for i in range(20)]
+    results = asyncio.run(analyzer.analyze_images(images))
+    
+    assert [r["screenshot_type"] for r in results] == ["detail_view"] * 20
+    assert peak <= 5
+
+
+def test_concurrent_requests_share_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(image_analyzer, "ANALYZE_CONCURRENCY", 2)
+    analyzer = ImageAnalyzer(api_key="test-key")
+    active = 0
+    peak = 0
+    
+    async def fake_call_api(content):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return '{"screenshot_type": "feed_view"}'
+    
+    monkeypatch.setattr(analyzer, "_call_api", fake_call_api)
+    monkeypatch.setattr(image_analyzer, "resize_for_vlm", lambda data, mime_type: (data, mime_type))
+    
+    async def upload_concurrently():
+        # 模拟 4 个并发上传请求，每个请求一张截图
+        return await asyncio.gather(*(
+            analyzer.analyze_images([(bytes([i]) * 16, "image/png")])
+            for i in range(4)
+        ))
+    
+    results = asyncio.run(upload_concurrently())
+    
+    assert [r[0]["screenshot_type"] for r in results] == ["feed_view"] * 4
+    assert peak == 2
+
+def test_resize_for_vlm_flattens_transparency_onto_white(monkeypatch):
+    monkeypatch.setattr(image_analyzer, "VLM_MAX_EDGE", 64)
+    image = Image.new("RGBA", (128, 128), (0, 0, 0, 0))
+    image.paste((0, 0, 0, 255), (0, 0, 32, 32))
+    source = BytesIO()
+    image.save(source, format="PNG")
+    
+    data, mime_type = resize_for_vlm(source.getvalue(), "image/png")
+    
+    assert mime_type == "image/jpeg"
+    resized = Image.open(BytesIO(data))
+    assert resized.size == (64, 64)
+    # 透明区域为白色，不透明的黑色文字区域保持黑色
+    assert min(resized.getpixel((50, 50))) > 240
+    assert max(resized.getpixel((4, 4))) < 15
+
+
+def test_results_are_cached_once_as_bytes(monkeypatch):
+    analyzer = ImageAnalyzer(api_key="test-key")
+    writes = []
+    
+    class RecordingCache:
+        async def aget(self, key):
+            return None
+        
+        async def aset(self, key, value):
+            writes.append((key, value))
+    
+    async def fake_call_api(content):
+        images = sum(1 for part in content if part["type"] == "input_image")
+        # 批量调用返回无法对应的结果，迫使逐张识别
+        return "[]" if images > 1 else '{"screenshot_type": "detail_view"}'
+    
+    monkeypatch.setattr(analyzer, "_cache", RecordingCache())
+    monkeypatch.setattr(analyzer, "_call_api", fake_call_api)
+    monkeypatch.setattr(image_analyzer, "resize_for_vlm", lambda data, mime_type: (data, mime_type))
+    
+    asyncio.run(analyzer.analyze_images([(bytes([i]) * 16, "image/png") for i in range(3)]))
+    asyncio.run(analyzer.analyze_image(b"single", "image/png"))
+    
+    assert len(writes) == len({key for key, _ in writes}) == 4
+    assert all(isinstance(value, bytes) for _, value in writes)
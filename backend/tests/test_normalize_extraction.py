@@ -0,0 +1,63 @@
+"""
+截图识别结果规范化（normalize_extraction）的测试
+"""
+from api.routes import normalize_extraction
+
+
+def test_detail_view_returns_post_and_tagged_comments():
+    result = {
+        "screenshot_type": "detail_view",
+        "post_content": {"title": "标题", "content": "正文", "author": "作者", "likes": 12, "extra": "x"},
+        "comments": [{"author": "c", "content": "赞"}]
+    }
+    
+    posts, comments = normalize_extraction(result, 2)
+    
+    assert posts == [{
+        "title": "标题", "content": "正文", "author": "作者", "publish_time": None,
+        "likes": 12, "collects": None, "comments_count": None, "tags": (),
+        "screenshot_index": 3, "has_comments": True
+    }]
+    assert comments == [{"author": "c", "content": "赞", "post_title": "标题", "screenshot_index": 3}]
+    # 不修改原始识别结果
+    assert "screenshot_index" not in result["comments"][0]
+
+
+def test_detail_view_without_post_content():
+    assert normalize_extraction({"screenshot_type": "detail_view", "post_content": None}, 0) == ([], [])
+    assert normalize_extraction({"screenshot_type": "detail_view", "post_content": "text"}, 0) == ([], [])
+
+
+def test_feed_view_tags_each_post():
+    result = {"screenshot_type": "feed_view", "posts": [{"title": "F1"}, {"title": "F2"}]}
+    
+    posts, comments = normalize_extraction(result, 0)
+    
+    assert posts == [{"title": "F1", "screenshot_index": 1}, {"title": "F2", "screenshot_index": 1}]
+    assert comments == []
+
+
+def test_legacy_and_unknown_formats_use_posts_array():
+    assert normalize_extraction({"posts": [{"title": "L"}]}, 4) == ([{"title": "L", "screenshot_index": 5}], [])
+    assert normalize_extraction({}, 0) == ([], [])
+
+
+def test_null_fields_fall_back_to_defaults():
+    detail = {
+        "screenshot_type": "detail_view",
+        "post_content": {"title": None, "content": None, "likes": None, "tags": None},
+        "comments": [None, {"author": "c", "content": "ok"}]
+    }
+    
+    posts, comments = normalize_extraction(detail, 0)
+    
+    assert posts[0]["title"] == ""
+    assert posts[0]["content"] == ""
+    assert posts[0]["tags"] == ()
+    assert posts[0]["likes"] is None
+    assert [c["author"] for c in comments] == ["c"]
+    
+    assert normalize_extraction({"screenshot_type": "feed_view", "posts": None}, 0) == ([], [])
+    assert normalize_extraction({"screenshot_type": "feed_view", "posts": [None, {"title": "x"}]}, 0) == (
+        [{"title": "x", "screenshot_index": 1}], []
+    )
@@ -0,0 +1,39 @@
+"""
+报告生成服务的测试
+"""
+import asyncio
+
+from schema.response import SentimentDistribution, SentimentType
+from services import report_generator
+from services.report_generator import ReportGenerator
+
+
+def test_non_object_insights_fall_back_and_are_not_cached(monkeypatch):
+    generator = ReportGenerator(api_key="test-key")
+    calls = []
+    
+    async def fake_call_doubao(prompt, api_key):
+        calls.append(prompt)
+        return "[1, 2]"
+    
+    monkeypatch.setattr(report_generator, "call_doubao", fake_call_doubao)
+    
+    for _ in range(2):
+        insights = asyncio.run(generator.generate_insights([], SentimentDistribution(), [], []))
+        assert insights["insights"] == ["数据分析完成，请查看详细报告"]
+    assert len(calls) == 2
+
+
+def test_parse_keywords_unhashable_sentiment_falls_back_to_neutral():
+    generator = ReportGenerator(api_key="test-key")
+    keywords = generator.parse_keywords([
+        {"word": "a", "count": 2, "sentiment": {"value": "positive"}},
+        {"word": "b", "count": 1, "sentiment": ["negative"]},
+        {"word": "c", "count": "3", "sentiment": "negative"}
+    ])
+    
+    assert [(kw.word, kw.count, kw.sentiment) for kw in keywords] == [
+        ("a", 2, SentimentType.NEUTRAL),
+        ("b", 1, SentimentType.NEUTRAL),
+        ("c", 3, SentimentType.NEGATIVE)
+    ]
@@ -0,0 +1,146 @@
+"""
+情感分析服务的测试
+"""
+import asyncio
+
+from schema.response import SentimentType
+from services import sentiment_analyzer
+from services.sentiment_analyzer import SentimentAnalyzer, _merge_sentiment_results
+
+
+def test_merge_concatenates_posts_and_sums_keywords():
+    merged = _merge_sentiment_results([
+        {
+            "analyzed_posts": [{"original_title": "A", "sentiment": "positive"}],
+            "top_keywords": [{"word": "好用", "count": 2, "sentiment": "positive"}],
+            "risk_alerts": [{"level": "high", "description": "d"}],
+            "sentiment_summary": "s1"
+        },
+        {
+            "analyzed_posts": [
+                {"original_title": "B", "sentiment": "negative"},
+                {"original_title": "C", "sentiment": "negative"}
+            ],
+            "top_keywords": [
+                {"word": "好用", "count": 3, "sentiment": "neutral"},
+                {"word": "贵", "count": 1, "sentiment": "negative"}
+            ],
+            "risk_alerts": [{"level": "high", "description": "d"}],
+            "sentiment_summary": "s2"
+        }
+    ])
+    
+    assert [p["original_title"] for p in merged["analyzed_posts"]] == ["A", "B", "C"]
+    assert merged["top_keywords"] == [
+        {"word": "好用", "count": 5, "sentiment": "neutral"},
+        {"word": "贵", "count": 1, "sentiment": "negative"}
+    ]
+    assert merged["risk_alerts"] == [{"level": "high", "description": "d"}]
+    assert merged["overall_sentiment"] == "negative"
+    assert merged["sentiment_summary"] == "s1\ns2"
+
+
+def test_merge_tolerates_malformed_keyword_rows():
+    merged = _merge_sentiment_results([
+        {
+            "top_keywords": [
+                {"word": "a", "count": 0},
+                {"word": "b", "count": -2, "sentiment": "negative"},
+                {"word": "c", "count": "3"},
+                {"word": ""},
+                "not-a-dict"
+            ],
+            "risk_alerts": [None]
+        }
+    ])
+    
+    assert merged["top_keywords"] == [
+        {"word": "a", "count": 1, "sentiment": "neutral"},
+        {"word": "b", "count": 1, "sentiment": "negative"},
+        {"word": "c", "count": 1, "sentiment": "neutral"}
+    ]
+    assert merged["risk_alerts"] == []
+    assert merged["overall_sentiment"] == "neutral"
+
+
+def test_merge_post_info_coerces_model_output():
+    analyzer = SentimentAnalyzer(api_key="test-key")
+    posts = analyzer.merge_post_info(
+        [
+            {"title": "A", "content": 123, "author": None, "likes": "12", "comments": "1.2万"},
+            {"title": 42}
+        ],
+        [
+            {"original_title": "A", "sentiment": "negative", "sentiment_score": -3, "keywords": "a,b"},
+            {"original_title": "42", "sentiment": "unknown", "sentiment_score": "x", "keywords": ["k", 1]},
+            "not-a-dict"
+        ]
+    )
+    
+    first, second = posts
+    assert (first.title, first.content, first.author) == ("A", "123", "")
+    assert (first.likes, first.comments) == (12, None)
+    assert first.sentiment is SentimentType.NEGATIVE
+    assert first.sentiment_score == -1.0
+    assert first.keywords == []
+    assert second.title == "42"
+    assert second.sentiment is SentimentType.NEUTRAL
+    assert second.sentiment_score == 0.0
+    assert second.keywords == ["k", "1"]
+
+
+def test_merge_post_info_unhashable_sentiment_falls_back_to_neutral():
+    analyzer = SentimentAnalyzer(api_key="test-key")
+    posts = analyzer.merge_post_info(
+        [{"title": "a"}, {"title": "b"}],
+        [
+            {"original_title": "a", "sentiment": ["positive"]},
+            {"original_title": "b", "sentiment": {"value": "negative"}}
+        ]
+    )
+    
+    assert [post.sentiment for post in posts] == [SentimentType.NEUTRAL, SentimentType.NEUTRAL]
+
+
+def test_non_object_response_is_not_cached(monkeypatch):
+    analyzer = SentimentAnalyzer(api_key="test-key")
+    responses = iter(['["not", "an", "object"]', '{"analyzed_posts": [], "overall_sentiment": "positive"}'])
+    
+    async def fake_call_doubao(prompt, api_key):
+        return next(responses)
+    
+    monkeypatch.setattr(sentiment_analyzer, "call_doubao", fake_call_doubao)
+    posts = [{"title": "A"}]
+    
+    first = asyncio.run(analyzer.analyze_sentiment(posts))
+    second = asyncio.run(analyzer.analyze_sentiment(posts))
+    
+    assert "error" in first
+    assert second["overall_sentiment"] == "positive"
+
+
+def test_merge_counts_unhashable_post_sentiment_as_neutral():
+    merged = _merge_sentiment_results([
+        {"analyzed_posts": [
+            {"sentiment": ["negative"]},
+            {"sentiment": {"v": 1}},
+            {"sentiment": "negative"}
+        ]}
+    ])
+    
+    assert merged["overall_sentiment"] == "neutral"
+
+
+def test_all_unparseable_batches_report_batch_count(monkeypatch):
+    monkeypatch.setattr(sentiment_analyzer, "SENTIMENT_BATCH_SIZE", 1)
+    analyzer = SentimentAnalyzer(api_key="test-key")
+    
+    async def fake_call_doubao(prompt, api_key):
+        return "not json"
+    
+    monkeypatch.setattr(sentiment_analyzer, "call_doubao", fake_call_doubao)
+    
+    result = asyncio.run(analyzer.analyze_sentiment([{"title": "A"}, {"title": "B"}, {"title": "C"}]))
+    
+    assert result["analyzed_posts"] == []
+    assert result["error"].startswith("全部 3 批结果均无法解析")